@@ -6,23 +6,28 @@ import streamlit as st
 import os
 import time
 from src.nlp.preprocessor import preprocess_query
-from src.nlp.semantic_search import find_best_match
+from src.nlp.semantic_search import find_best_match, build_knowledge_base_index, get_query_embedding
 from src.nlp.entity_extractor import extract_entities_from_query
 from src.nlp.sentiment import analyze_query_sentiment
+from src.nlp.lexical_search import find_lexical_matches, merge_matches
+from src.database.interaction_writer import get_interaction_writer
+from src.database.migrations import ensure_migrated
 from src.database.query import get_knowledge_base, log_interaction
 from src.prompts.templates import create_enhanced_prompt
-from src.feedback.evaluator import evaluate_response
+from src.feedback.evaluator import evaluate_response, evaluate_response_stream
+from src.models.providers import ProviderError
+from src.models.resilience import generate_response
+from src.models.response_cache import get_response_cache
 from src.utils.config import get_config
 from src.utils.helpers import get_random_greeting
+from src.utils.lazy import start_background_warmup
+from src.utils.pipeline import StageGraph
+from src.utils.tracing import start_trace, end_trace
 
 # Determine which model client to use based on configuration
 config = get_config()
 model_type = config['models'].get('default', 'groq')
-
-if model_type == 'groq':
-    from src.models.groq_client import generate_response
-else:
-    from src.models.ollama_client import generate_response
+stream_responses = config['models'].get('stream', True)
 
 # Page configuration
 st.set_page_config(
@@ -106,40 +111,161 @@ st.title("SmartHaven Support")
 # Display chat history
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):
-        st.markdown(message["content"])
+        if message.get("error"):
+            st.error(message["content"])
+        else:
+            st.markdown(message["content"])
+        if message.get("cached"):
+            st.caption("⚡ Answered from cache")
+
+# Apply pending schema migrations (once per process)
+ensure_migrated()
 
 # Load knowledge base
 knowledge_base = get_knowledge_base()
 
+# Drop cached answers built on rows that changed since the last snapshot
+if get_response_cache() is not None:
+    get_response_cache().sync_knowledge_base(knowledge_base)
+
+# Create the interactions schema and start the background log writer
+get_interaction_writer().start()
+
+# Load models and build the embedding index in the background once the
+# page is up; anything not warm yet is loaded on first use instead
+if config['nlp'].get('background_warmup', True):
+    start_background_warmup([
+        lambda: build_knowledge_base_index(knowledge_base),
+        lambda: extract_entities_from_query("warm up", knowledge_base),
+        lambda: preprocess_query("warm up"),
+        lambda: analyze_query_sentiment("warm up"),
+    ])
+
 # Function to process the query and generate a response
 
 
+def stream_response(query, prompt, timings):
+    """Stream the evaluated response, recording time to first token and total time"""
+    start = time.perf_counter()
+
+    chunks = generate_response(prompt, stream=True)
+
+    for chunk in evaluate_response_stream(query, chunks):
+        if 'first_token' not in timings:
+            timings['first_token'] = time.perf_counter() - start
+        yield chunk
+
+    timings['total'] = time.perf_counter() - start
+
+
+def run_nlp_stages(query):
+    """
+    Run the independent NLP stages concurrently (steps 1 to 3)
+    A stage that exceeds its pipeline.stage_timeouts entry falls back to an
+    empty result so the response isn't held up
+    """
+    timeouts = (config.get('pipeline') or {}).get('stage_timeouts') or {}
+
+    graph = StageGraph()
+    graph.add('preprocessed_query', lambda: preprocess_query(query),
+              timeout=timeouts.get('preprocess'), default=[])
+    graph.add('entities', lambda: extract_entities_from_query(query, knowledge_base),
+              timeout=timeouts.get('entities'),
+              default={'products': [], 'issues': [], 'parts': [], 'locations': [],
+                       'mentions': []})
+    graph.add('sentiment', lambda: analyze_query_sentiment(query),
+              timeout=timeouts.get('sentiment'), default=None)
+    graph.add('matches', lambda: find_best_match(query, knowledge_base),
+              timeout=timeouts.get('retrieval'), default=[])
+    if config['nlp'].get('lexical_retrieval', True):
+        graph.add('lexical_matches', lambda: find_lexical_matches(query),
+                  timeout=timeouts.get('lexical_retrieval'), default=[])
+
+    return graph.run()
+
+
 def process_and_respond(query):
+    """
+    Render the response inside the current chat message
+    Returns the response, whether it was served from the response cache and
+    whether it is an error message
+    """
+    # Trace the turn; stages record their own spans into it
+    trace = start_trace()
+    try:
+        response, cached = respond(query, trace)
+        return response, cached, False
+    except ProviderError as e:
+        # Not an answer: show it, but don't cache or log it as an interaction
+        print(f"Warning: No LLM provider could answer. Error: {e}")
+        message = ("Sorry, the language model is unavailable right now. "
+                   "Please try again in a moment.")
+        st.error(message)
+        return message, False, True
+    finally:
+        end_trace()
+
+
+def respond(query, trace):
     # Show a spinner while processing
     with st.spinner("Processing your query..."):
-        # Step 1: Preprocess the query
-        preprocessed_query = preprocess_query(query)
-
-        # Step 2: Extract entities and analyze sentiment
-        entities = extract_entities_from_query(query, knowledge_base)
-        sentiment = analyze_query_sentiment(query)
+        # Steps 1-3: Preprocess, extract entities, analyze sentiment and
+        # find the best knowledge base matches, all at the same time
+        with trace.span('nlp_stages'):
+            stage_results, stage_report = run_nlp_stages(query)
+        if stage_report['timed_out']:
+            trace.record('timed_out_stages', stage_report['timed_out'])
+        preprocessed_query = stage_results['preprocessed_query']
+        entities = stage_results['entities']
+        sentiment = stage_results['sentiment']
+        # Hybrid retrieval: semantic matches fused with BM25 keyword matches
+        matches = merge_matches(stage_results['matches'],
+                                stage_results.get('lexical_matches', []))
 
-        # Step 3: Find best matches in knowledge base
-        matches = find_best_match(query, knowledge_base)
+        # Serve near-duplicate questions from the response cache
+        response_cache = get_response_cache()
+        if response_cache is not None:
+            query_embedding = get_query_embedding(query)
+            cached_response = response_cache.lookup(query_embedding, matches)
+            trace.record('response_cache_hit', cached_response is not None)
+            if cached_response is not None:
+                st.markdown(cached_response)
+                st.caption("⚡ Answered from cache")
+                log_interaction(query, cached_response, trace=trace.to_dict())
+                return cached_response, True
 
         # Step 4: Create enhanced prompt with dynamic prompt engineering
         enhanced_prompt = create_enhanced_prompt(query, matches)
 
-        # Step 5: Generate response using LLM
-        response = generate_response(enhanced_prompt)
+    if stream_responses:
+        # Steps 5 and 6: Render tokens as they arrive, evaluation adds to the end
+        timings = {}
+        final_response = st.write_stream(
+            stream_response(query, enhanced_prompt, timings))
+        trace.add_span('llm', timings.get('total', 0))
+        trace.record('time_to_first_token_ms',
+                     timings.get('first_token', 0) * 1000)
+        st.caption(
+            f"First token {timings.get('first_token', 0):.2f}s • "
+            f"total {timings.get('total', 0):.2f}s")
+    else:
+        with st.spinner("Generating response..."):
+            # Step 5: Generate response using LLM
+            with trace.span('llm'):
+                response = generate_response(enhanced_prompt)
+
+            # Step 6: Evaluate and improve response
+            final_response = evaluate_response(query, response)
+        st.markdown(final_response)
 
-        # Step 6: Evaluate and improve response
-        final_response = evaluate_response(query, response)
+    # Cache the response for near-duplicate questions
+    if response_cache is not None:
+        response_cache.store(query_embedding, matches, final_response)
 
-        # Log the interaction
-        log_interaction(query, final_response)
+    # Log the interaction together with its trace
+    log_interaction(query, final_response, trace=trace.to_dict())
 
-        return final_response
+    return final_response, False
 
 
 # Get user input
@@ -151,14 +277,14 @@ if prompt := st.chat_input("Ask about your industrial equipment..."):
     with st.chat_message("user"):
         st.markdown(prompt)
 
-    # Display assistant response with a spinner for processing time
+    # Display assistant response as it is generated
     with st.chat_message("assistant"):
-        response = process_and_respond(prompt)
-        st.markdown(response)
+        response, cached, error = process_and_respond(prompt)
 
     # Add assistant response to chat history
     st.session_state.messages.append(
-        {"role": "assistant", "content": response})
+        {"role": "assistant", "content": response, "cached": cached,
+         "error": error})
 
 # Add a footer
 st.markdown("---")
@@ -1,21 +1,28 @@
-import torch
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
-import numpy as np
+from src.nlp.embedding_cache import encode_query
+from src.nlp.embedding_index import EmbeddingIndex, get_index_path
+from src.nlp.model_registry import get_sentence_model
+from src.nlp.topk import TopKScorer
 from src.utils.config import get_config
 
 
 class EnhancedRetriever:
     def __init__(self, knowledge_base=None):
         config = get_config()
-        # Load the sentence transformer model
+        # Use the shared sentence transformer model
         model_name = config['nlp'].get(
             'sentence_transformer', 'all-MiniLM-L6-v2')
-        self.model = SentenceTransformer(model_name)
+        self.model_name = model_name
+        self.model = get_sentence_model(model_name)
+
+        # Persistent chunk index, only re-encodes rows that changed
+        self.index = EmbeddingIndex(
+            self.model, model_name,
+            path=get_index_path(config['database']['path'], 'chunks'))
 
         # Store knowledge base
         self.knowledge_base = knowledge_base
         self.encoded_chunks = None
+        self.scorer = TopKScorer()
         self.chunk_metadata = []
 
         # If knowledge base is provided, encode it immediately
@@ -25,6 +32,7 @@ class EnhancedRetriever:
     def prepare_knowledge_base(self):
         """Process and encode the knowledge base for efficient retrieval"""
         chunks = []
+        chunk_keys = []
         self.chunk_metadata = []
 
         # Process FAQs
@@ -33,6 +41,7 @@ class EnhancedRetriever:
                 # Create a chunk from the question and answer
                 chunk_text = f"Question: {faq['question']} Answer: {faq['answer']}"
                 chunks.append(chunk_text)
+                chunk_keys.append(f"faq:{faq['id']}")
                 self.chunk_metadata.append({
                     'type': 'faq',
                     'id': faq['id'],
@@ -46,6 +55,7 @@ class EnhancedRetriever:
                 # Create a chunk from the description and solution
                 chunk_text = f"Problem: {complaint['description']} Solution: {complaint['solution']}"
                 chunks.append(chunk_text)
+                chunk_keys.append(f"complaint:{complaint['id']}")
                 self.chunk_metadata.append({
                     'type': 'complaint',
                     'id': complaint['id'],
@@ -59,6 +69,7 @@ class EnhancedRetriever:
                 # Create a chunk from the product information
                 chunk_text = f"Product: {product['name']} Description: {product['description']} Category: {product['category']}"
                 chunks.append(chunk_text)
+                chunk_keys.append(f"product:{product['id']}")
                 self.chunk_metadata.append({
                     'type': 'product',
                     'id': product['id'],
@@ -66,32 +77,47 @@ class EnhancedRetriever:
                     'source': f"Product #{product['id']}"
                 })
 
-        # Encode all chunks
+        # Encode new or edited chunks, reusing the rest from the index
         if chunks:
-            self.encoded_chunks = self.model.encode(chunks)
+            self.encoded_chunks = self.index.sync(chunk_keys, chunks)
+        else:
+            self.encoded_chunks = None
+        self.scorer.fit(self.encoded_chunks)
+
+    def refresh(self, knowledge_base):
+        """Update the retriever after knowledge base rows changed"""
+        self.knowledge_base = knowledge_base
+        self.prepare_knowledge_base()
 
     def retrieve(self, query, top_k=5):
         """Retrieve the most relevant chunks for a query"""
-        if self.encoded_chunks is None or len(self.encoded_chunks) == 0:
+        if len(self.scorer) == 0:
             return []
 
         # Encode the query
-        query_embedding = self.model.encode(query)
+        query_embedding = encode_query(self.model, self.model_name, query)
+
+        # Score against the normalised chunk matrix and keep the top-k
+        return self._format_results(self.scorer.search(query_embedding, top_k))
 
-        # Calculate similarities
-        similarities = cosine_similarity(
-            [query_embedding], self.encoded_chunks)[0]
+    def retrieve_batch(self, queries, top_k=5):
+        """Retrieve chunks for several queries, scored in one matrix product"""
+        if len(self.scorer) == 0:
+            return [[] for _ in queries]
 
-        # Get indices of top-k most similar chunks
-        top_indices = np.argsort(similarities)[::-1][:top_k]
+        query_embeddings = [encode_query(self.model, self.model_name, query)
+                            for query in queries]
+        return [self._format_results(found)
+                for found in self.scorer.search_batch(query_embeddings, top_k)]
 
-        # Return the chunks and their metadata
+    def _format_results(self, found):
+        """Return the chunks and their metadata"""
         results = []
-        for idx in top_indices:
+        for idx, similarity in found:
             results.append({
                 'text': self.get_chunk_text(idx),
                 'metadata': self.chunk_metadata[idx],
-                'similarity': float(similarities[idx])
+                'similarity': similarity
             })
 
         return results
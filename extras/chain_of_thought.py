@@ -1,5 +1,5 @@
-# Or use ollama_client based on your config
-from src.models.groq_client import generate_response
+# Uses the configured provider, failing over to the other one
+from src.models.resilience import generate_response
 
 
 class TechnicalReasoner:
@@ -1,8 +1,8 @@
 import json
 import os
-import numpy as np
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+from src.nlp.embedding_cache import encode_query
+from src.nlp.model_registry import get_sentence_model
+from src.nlp.topk import TopKScorer
 from src.utils.config import get_config
 
 
@@ -11,11 +11,13 @@ class FewShotLearner:
         config = get_config()
         model_name = config['nlp'].get(
             'sentence_transformer', 'all-MiniLM-L6-v2')
-        self.model = SentenceTransformer(model_name)
+        self.model_name = model_name
+        self.model = get_sentence_model(model_name)
 
         # Load examples if file is provided
         self.examples = []
         self.embeddings = None
+        self.scorer = TopKScorer()
 
         if examples_file and os.path.exists(examples_file):
             self.load_examples(examples_file)
@@ -69,6 +71,7 @@ class FewShotLearner:
 
         texts = [ex["query"] for ex in self.examples]
         self.embeddings = self.model.encode(texts)
+        self.scorer.fit(self.embeddings)
 
     def get_similar_examples(self, query, num_examples=2):
         """Get examples similar to the given query"""
@@ -76,16 +79,13 @@ class FewShotLearner:
             return []
 
         # Encode the query
-        query_embedding = self.model.encode(query)
+        query_embedding = encode_query(self.model, self.model_name, query)
 
-        # Calculate similarities
-        similarities = cosine_similarity([query_embedding], self.embeddings)[0]
-
-        # Get indices of top examples
-        top_indices = np.argsort(similarities)[::-1][:num_examples]
+        # Score against the normalised example matrix and keep the top ones
+        top_examples = self.scorer.search(query_embedding, num_examples)
 
         # Return the top examples
-        return [self.examples[i] for i in top_indices]
+        return [self.examples[i] for i, _ in top_examples]
 
     def create_few_shot_prompt(self, query, examples=None):
         """Create a prompt with few-shot examples"""
@@ -4,21 +4,22 @@ Analytics dashboard for chatbot performance
 
 import streamlit as st
 import pandas as pd
-import sqlite3
 import altair as alt
 from datetime import datetime, timedelta
-from src.utils.config import get_config
+from src.nlp.embedding_cache import get_embedding_cache
+from src.database.interaction_writer import get_interaction_writer
+from src.models.resilience import get_llm_stats
+from src.models.response_cache import get_response_cache
+from src.nlp.model_registry import get_model_stats
+from src.database.query import (
+    SEARCH_SOURCES, get_interaction_stats, get_stage_latency, get_top_queries,
+    get_trace_stats, search)
 
 st.set_page_config(page_title="Chatbot Analytics",
                    page_icon="📊", layout="wide")
 
 st.title("Industrial Chatbot Analytics")
 
-# Connect to database
-config = get_config()
-db_path = config['database']['path']
-conn = sqlite3.connect(db_path)
-
 # Date range selector
 st.sidebar.header("Filter Options")
 date_range = st.sidebar.selectbox(
@@ -39,25 +40,9 @@ elif date_range == "Last 30 days":
 else:  # All time
     start_date = datetime(2000, 1, 1).date()
 
-# Query interactions table
-query = f"""
-SELECT 
-    DATE(timestamp) as date,
-    COUNT(*) as interaction_count,
-    AVG(LENGTH(query)) as avg_query_length,
-    COUNT(CASE WHEN feedback = 'positive' THEN 1 END) as positive_feedback,
-    COUNT(CASE WHEN feedback = 'negative' THEN 1 END) as negative_feedback
-FROM 
-    interactions
-WHERE 
-    DATE(timestamp) >= '{start_date}'
-GROUP BY 
-    DATE(timestamp)
-ORDER BY 
-    date
-"""
-
-df = pd.read_sql_query(query, conn)
+# Daily (or, for today, hourly) counts from the rollup tables
+period = 'hour' if date_range == "Today" else 'day'
+df = pd.DataFrame(get_interaction_stats(str(start_date), by=period))
 
 # Check if we have data
 if df.empty:
@@ -68,9 +53,9 @@ else:
 
     # Create first chart - Interactions over time
     interactions_chart = alt.Chart(df).mark_line(point=True).encode(
-        x='date:T',
+        x=alt.X('period:T', title=period.capitalize()),
         y='interaction_count:Q',
-        tooltip=['date', 'interaction_count']
+        tooltip=['period', 'interaction_count']
     ).properties(
         title="Interactions Over Time",
         width=400
@@ -101,27 +86,107 @@ else:
     # Top queries section
     st.header("Top Queries")
 
-    top_queries_query = f"""
-    SELECT 
-        query, 
-        COUNT(*) as count
-    FROM 
-        interactions
-    WHERE 
-        DATE(timestamp) >= '{start_date}'
-    GROUP BY 
-        query
-    ORDER BY 
-        count DESC
-    LIMIT 10
-    """
-
-    top_queries_df = pd.read_sql_query(top_queries_query, conn)
+    top_queries_df = pd.DataFrame(get_top_queries(str(start_date)))
 
     if not top_queries_df.empty:
         st.table(top_queries_df)
     else:
         st.info("No queries available for the selected time period.")
 
-# Close connection
-conn.close()
+# Keyword search over the knowledge base and past interactions
+st.header("Search")
+search_text = st.text_input("Search the knowledge base and past interactions")
+search_sources = st.multiselect(
+    "Search in", list(SEARCH_SOURCES), default=list(SEARCH_SOURCES))
+if search_text and search_sources:
+    search_results = search(search_text, sources=search_sources, limit=20)
+    if search_results:
+        st.table(pd.DataFrame([
+            {'Type': r['type'], 'ID': r['id'], 'Score': round(r['score'], 2),
+             'Match': r['snippet']} for r in search_results]))
+    else:
+        st.info("No matches found.")
+
+# Per-stage latency from the histograms kept up to date with each traced
+# interaction (percentiles are bucket upper bounds, at most 25% high)
+st.header("Pipeline Latency")
+
+stage_latency = get_stage_latency(str(start_date))
+if not stage_latency:
+    st.info("No traced interactions for the selected time period.")
+else:
+    percentiles = pd.DataFrame(stage_latency).set_index('stage')[
+        ['p50', 'p95', 'p99']]
+    percentiles.columns = ['p50 (ms)', 'p95 (ms)', 'p99 (ms)']
+    st.table(percentiles.round(1))
+
+    # p95 per stage per day
+    daily_p95 = pd.DataFrame(get_stage_latency(
+        str(start_date), quantiles=(0.95,), by_day=True)).rename(
+        columns={'day': 'date', 'p95': 'ms'})
+    latency_chart = alt.Chart(daily_p95).mark_line(point=True).encode(
+        x='date:T',
+        y=alt.Y('ms:Q', title='p95 latency (ms)'),
+        color='stage:N',
+        tooltip=['date', 'stage', 'ms']
+    ).properties(title="p95 Latency per Stage Over Time")
+    st.altair_chart(latency_chart, use_container_width=True)
+
+    trace_stats = get_trace_stats(str(start_date))
+    token_col1, token_col2, token_col3 = st.columns(3)
+    if trace_stats['avg_prompt_tokens'] is not None:
+        token_col1.metric("Avg Prompt Tokens",
+                          f"{trace_stats['avg_prompt_tokens']:.0f}")
+    if trace_stats['avg_completion_tokens'] is not None:
+        token_col2.metric("Avg Completion Tokens",
+                          f"{trace_stats['avg_completion_tokens']:.0f}")
+    if trace_stats['cache_hit_rate'] is not None:
+        token_col3.metric("Turns Answered From Cache",
+                          f"{trace_stats['cache_hit_rate']:.0%}")
+
+# Embedding models loaded in this process
+st.header("Embedding Models")
+model_stats = get_model_stats()
+if model_stats:
+    st.table(pd.DataFrame(model_stats))
+else:
+    st.info("No embedding models loaded yet.")
+
+# Query embedding cache
+cache_stats = get_embedding_cache().stats()
+cache_col1, cache_col2, cache_col3 = st.columns(3)
+cache_col1.metric("Query Cache Hit Rate", f"{cache_stats['hit_rate']:.0%}")
+cache_col2.metric("Cache Hits / Misses",
+                  f"{cache_stats['hits']} / {cache_stats['misses']}")
+cache_col3.metric("Cached Queries",
+                  f"{cache_stats['size']} / {cache_stats['max_size']}")
+
+# Semantic response cache
+response_cache = get_response_cache()
+if response_cache is not None:
+    response_stats = response_cache.stats()
+    resp_col1, resp_col2, resp_col3 = st.columns(3)
+    resp_col1.metric("Response Cache Hit Rate",
+                     f"{response_stats['hit_rate']:.0%}")
+    resp_col2.metric("Answers Served From Cache", response_stats['hits'])
+    resp_col3.metric("Cached Answers",
+                     f"{response_stats['size']} / {response_stats['max_entries']}")
+
+# LLM providers: circuit breakers and coalesced identical requests
+llm_stats = get_llm_stats()
+flight_stats = llm_stats['single_flight']
+if flight_stats is not None:
+    flight_col1, flight_col2, flight_col3 = st.columns(3)
+    flight_col1.metric("LLM Requests", flight_stats['requests'])
+    flight_col2.metric("Deduplicated LLM Calls", flight_stats['deduplicated'])
+    flight_col3.metric("LLM Calls In Flight", flight_stats['in_flight'])
+st.table(pd.DataFrame(llm_stats['providers']).T)
+
+# Background interaction log writer
+writer_stats = get_interaction_writer().stats()
+writer_col1, writer_col2, writer_col3 = st.columns(3)
+writer_col1.metric("Interaction Log Queue",
+                   f"{writer_stats['queue_depth']} / {writer_stats['max_queue']}")
+writer_col2.metric("Interactions Written", writer_stats['written'])
+writer_col3.metric("Interactions Dropped / Failed",
+                   f"{writer_stats['dropped']} / {writer_stats['failed']}")
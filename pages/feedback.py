@@ -4,18 +4,15 @@ Feedback collection page for the chatbot
 
 import streamlit as st
 import pandas as pd
-import sqlite3
 from datetime import datetime
-from src.utils.config import get_config
+from src.database.query import get_db_connection
 
 st.set_page_config(page_title="Chatbot Feedback", page_icon="💬")
 
 st.title("Provide Feedback on Industrial Chatbot")
 
-# Connect to database
-config = get_config()
-db_path = config['database']['path']
-conn = sqlite3.connect(db_path)
+# Connect to database (this thread's pooled connection, don't close it)
+conn = get_db_connection()
 cursor = conn.cursor()
 
 # Create feedback table if it doesn't exist
@@ -99,6 +96,3 @@ if admin_view:
             st.info("No feedback available yet.")
     elif password:
         st.error("Incorrect password")
-
-# Close connection
-conn.close()
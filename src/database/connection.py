@@ -0,0 +1,105 @@
+"""
+SQLite connection management
+
+All database access goes through here so every connection gets the same
+settings: WAL journal mode (readers don't block the writer and the
+writer doesn't block readers), synchronous=NORMAL, a larger page cache,
+memory-mapped reads, a busy timeout and a prepared-statement cache.
+
+get_connection() returns a connection owned by the calling thread and
+reused for the thread's lifetime, so its prepared statements are reused
+too. Don't close it; connections of threads that have exited are closed
+when the next connection is created. connect() opens a separate
+connection for long-lived owners such as background threads.
+"""
+
+import sqlite3
+import threading
+from src.utils.config import get_config
+
+DEFAULT_SETTINGS = {
+    'busy_timeout_ms': 5000,
+    'cache_size_kb': 16384,        # page cache per connection
+    'mmap_size_mb': 256,           # 0 disables memory-mapped I/O
+    'synchronous': 'NORMAL',       # safe with WAL; FULL also syncs every commit
+    'cached_statements': 256,      # prepared statements kept per connection
+}
+
+
+def get_connection_settings():
+    """Connection settings from the database.connection config section"""
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update(get_config()['database'].get('connection') or {})
+    return settings
+
+
+def connect(db_path=None, check_same_thread=True, settings=None):
+    """Open a new configured connection; the caller closes it"""
+    settings = settings or get_connection_settings()
+    if db_path is None:
+        db_path = get_config()['database']['path']
+
+    conn = sqlite3.connect(
+        db_path,
+        timeout=settings['busy_timeout_ms'] / 1000,
+        check_same_thread=check_same_thread,
+        cached_statements=settings['cached_statements'])
+    conn.row_factory = sqlite3.Row
+
+    # journal_mode is stored in the database file, the rest is per connection
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute(f"PRAGMA synchronous = {settings['synchronous']}")
+    conn.execute(f"PRAGMA busy_timeout = {int(settings['busy_timeout_ms'])}")
+    conn.execute(f"PRAGMA cache_size = -{int(settings['cache_size_kb'])}")
+    conn.execute(f"PRAGMA mmap_size = {int(settings['mmap_size_mb']) * 1024 * 1024}")
+    conn.execute('PRAGMA temp_store = MEMORY')
+    return conn
+
+
+class ConnectionPool:
+    """One connection per (thread, database path)"""
+
+    def __init__(self):
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    def get(self, db_path=None):
+        if db_path is None:
+            db_path = get_config()['database']['path']
+        thread = threading.current_thread()
+        key = (thread, db_path)
+
+        conn = self._connections.get(key)
+        if conn is not None:
+            return conn
+
+        # Only the owning thread uses it; check_same_thread is off so the
+        # pool can close it after the thread has gone
+        conn = connect(db_path, check_same_thread=False)
+        with self._lock:
+            self._close_dead_threads()
+            self._connections[key] = conn
+        return conn
+
+    def _close_dead_threads(self):
+        for key in [k for k in self._connections if not k[0].is_alive()]:
+            self._connections.pop(key).close()
+
+    def close_all(self):
+        """Close every pooled connection, e.g. before replacing the database"""
+        with self._lock:
+            for conn in self._connections.values():
+                conn.close()
+            self._connections.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'connections': len(self._connections)}
+
+
+pool = ConnectionPool()
+
+
+def get_connection(db_path=None):
+    """Get the calling thread's pooled connection to the database"""
+    return pool.get(db_path)
@@ -1,11 +1,11 @@
-import sqlite3
 import json
 import os
+from src.database.connection import connect
 
 
 def initialize_database():
     """Initialize the database with tables for products, complaints, and FAQs"""
-    conn = sqlite3.connect('data/industrial_knowledge.db')
+    conn = connect('data/industrial_knowledge.db')
     cursor = conn.cursor()
 
     # Create tables for products, complaints, and FAQs
@@ -40,6 +40,17 @@ def initialize_database():
     )
     ''')
 
+    # Track knowledge base changes so cached snapshots know when to reload
+    create_change_tracking(cursor)
+
+    create_interactions_table(cursor)
+    conn.commit()
+
+    # Bring the tables up to the current schema version (imported here as
+    # migrations builds on the tables above)
+    from src.database.migrations import migrate
+    migrate(conn)
+
     # Load sample data if tables are empty
     cursor.execute('SELECT COUNT(*) FROM products')
     if cursor.fetchone()[0] == 0:
@@ -49,24 +60,62 @@ def initialize_database():
     return conn
 
 
+# Tables whose changes bump the knowledge base version
+KNOWLEDGE_BASE_TABLES = ['products', 'complaints', 'faqs']
+
+
+def create_change_tracking(cursor):
+    """Create the kb_version counter and the triggers that bump it"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS kb_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO kb_version (id, version) VALUES (1, 0)')
+
+    for table in KNOWLEDGE_BASE_TABLES:
+        for event in ['INSERT', 'UPDATE', 'DELETE']:
+            cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_kb_version
+            AFTER {event} ON {table}
+            BEGIN
+                UPDATE kb_version SET version = version + 1 WHERE id = 1;
+            END
+            ''')
+
+
+def create_interactions_table(cursor):
+    """Create the interactions log table (later columns are added by migrations)"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS interactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        query TEXT,
+        response TEXT,
+        feedback TEXT
+    )
+    ''')
+
+
 def load_sample_data(conn, cursor):
     """Load sample data from JSON files"""
     # Load products
     with open('data/products.json', 'r') as f:
         products = json.load(f)
         cursor.executemany(
-            'INSERT INTO products (id, name, category, description) VALUES (?, ?, ?, ?)',
-            [(p['id'], p['name'], p['category'], p['description'])
-             for p in products]
+            'INSERT INTO products (id, name, category, description, price, launch_date) VALUES (?, ?, ?, ?, ?, ?)',
+            [(p['id'], p['name'], p['category'], p['description'],
+              p.get('price'), p.get('launch_date')) for p in products]
         )
 
     # Load complaints
     with open('data/complaints.json', 'r') as f:
         complaints = json.load(f)
         cursor.executemany(
-            'INSERT INTO complaints (id, product_id, issue_type, description, solution) VALUES (?, ?, ?, ?, ?)',
+            'INSERT INTO complaints (id, product_id, issue_type, description, solution, frequency) VALUES (?, ?, ?, ?, ?, ?)',
             [(c['id'], c['product_id'], c['issue_type'],
-              c['description'], c['solution']) for c in complaints]
+              c['description'], c['solution'], c.get('frequency')) for c in complaints]
         )
 
     # Load FAQs
@@ -0,0 +1,268 @@
+"""
+Buffered, batched writer for the interactions table
+
+Chat turns hand their interaction to an in-memory queue and return
+straight away. A background thread writes the queue in batches, one
+transaction per batch, when batch_size records are waiting or
+flush_interval seconds after the first one arrived. A full queue makes
+callers wait (back-pressure) for up to put_timeout seconds; records that
+still don't fit are dropped and counted.
+"""
+
+import atexit
+import json
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from src.database.connection import connect
+from src.utils.config import get_config
+
+INSERT_INTERACTION = '''
+INSERT INTO interactions (timestamp, query, normalized_query, response, feedback, trace)
+VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+_STOP = object()
+
+
+def normalize_query_text(text):
+    """Case- and whitespace-insensitive form of a query, for the query rollups"""
+    return " ".join(text.split()).casefold() if text is not None else None
+
+
+class InteractionWriter:
+    def __init__(self, db_path, batch_size=50, flush_interval=1.0,
+                 max_queue=1000, put_timeout=5.0):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.put_timeout = put_timeout
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        # Guards the counters, which the writer thread and callers update
+        self._lock = threading.Lock()
+        self.closed = False
+
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def start(self):
+        """Migrate the schema and start the writer thread (once)"""
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            # Schema changes happen here, at startup, not per interaction;
+            # INSERT_INTERACTION needs the columns added by the migrations
+            # (imported here as migrations uses normalize_query_text)
+            from src.database.migrations import migrate_database
+            migrate_database(self.db_path)
+
+            self._thread = threading.Thread(
+                target=self._run, name="interaction-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, user_query, response, feedback=None, trace=None):
+        """
+        Queue an interaction for writing
+        trace (a tracing.Trace.to_dict() dict, not modified afterwards) gets
+        a 'log_interaction' span for the time spent here, including any
+        back-pressure wait, and is serialised on the writer thread
+        Returns False if it was dropped because the queue stayed full
+        """
+        started = time.perf_counter()
+        if self.closed:
+            raise RuntimeError("Interaction writer is closed")
+        self.start()
+        if self._thread is not None and not self._thread.is_alive():
+            # Nothing would ever take it off the queue
+            with self._lock:
+                self.dropped += 1
+            print("Warning: Interaction writer thread has stopped, dropped an interaction")
+            return False
+
+        # Timestamp now rather than when the batch is written (UTC, like
+        # CURRENT_TIMESTAMP)
+        timestamp = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        # Set once the record is queued; the writer can only pick the record
+        # up after that, so it is normally set by the time it is written
+        queued_at = [None]
+        record = (timestamp, user_query, normalize_query_text(user_query),
+                  response, feedback, trace, started, queued_at)
+        try:
+            self._queue.put(record, timeout=self.put_timeout)
+            queued_at[0] = time.perf_counter()
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            print(f"Warning: Interaction log queue is full ({self.max_queue} waiting), "
+                  f"dropped an interaction")
+            return False
+
+    def flush(self, timeout=None):
+        """
+        Block until everything queued so far has been written, for up to
+        timeout seconds (None waits as long as the writer thread runs)
+        Returns False if records are still waiting or were dropped
+        """
+        if self._thread is None:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        # Queue.join() with a timeout, giving up if the writer thread dies
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks and self._thread.is_alive():
+                wait = 0.1
+                if deadline is not None:
+                    wait = min(wait, deadline - time.monotonic())
+                    if wait <= 0:
+                        return False
+                self._queue.all_tasks_done.wait(wait)
+        # Outside the wait: it shares the queue's lock
+        if not self._thread.is_alive() and self._drop_unwritten():
+            return False
+        return self._queue.unfinished_tasks == 0
+
+    def close(self, timeout=10.0):
+        """
+        Write what is queued and stop the writer thread, waiting up to
+        timeout seconds for each
+        """
+        with self._start_lock:
+            if self.closed:
+                return
+            self.closed = True
+            thread = self._thread
+        if thread is None:
+            return
+        if thread.is_alive():
+            try:
+                self._queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                print(f"Warning: Interaction writer didn't drain its queue within "
+                      f"{timeout}s; {self._queue.qsize()} interactions not written")
+                return
+            thread.join(timeout)
+        if thread.is_alive():
+            print(f"Warning: Interaction writer didn't stop within {timeout}s; "
+                  f"{self._queue.qsize()} interactions not written yet")
+        else:
+            self._drop_unwritten()
+
+    def _drop_unwritten(self):
+        """
+        Count and report records left on the queue by a stopped writer
+        thread; returns how many
+        """
+        records = 0
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self._queue.task_done()
+            if item is not _STOP:
+                records += 1
+        if records:
+            with self._lock:
+                self.dropped += records
+            print(f"Warning: Interaction writer thread has stopped, "
+                  f"dropped {records} queued interactions")
+        return records
+
+    def stats(self):
+        """Queue depth and write counters"""
+        return {
+            'queue_depth': self._queue.qsize(),
+            'max_queue': self.max_queue,
+            'written': self.written,
+            'batches': self.batches,
+            'dropped': self.dropped,
+            'failed': self.failed
+        }
+
+    def _next_batch(self):
+        """Wait for a record, then gather a batch until full or the interval ends"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while batch[-1] is not _STOP and len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    @staticmethod
+    def _to_row(record):
+        """INSERT_INTERACTION parameters for a queued record"""
+        timestamp, user_query, normalized, response, feedback, trace, \
+            started, queued_at = record
+        if trace is not None:
+            spans = dict(trace.get('spans') or {})
+            spans['log_interaction'] = (
+                (queued_at[0] or time.perf_counter()) - started) * 1000
+            trace = json.dumps(dict(trace, spans=spans), default=str)
+        return (timestamp, user_query, normalized, response, feedback, trace)
+
+    def _write(self, conn, records):
+        try:
+            with conn:  # one transaction per batch
+                conn.executemany(INSERT_INTERACTION,
+                                 [self._to_row(record) for record in records])
+            with self._lock:
+                self.written += len(records)
+                self.batches += 1
+        except sqlite3.Error as e:
+            with self._lock:
+                self.failed += len(records)
+            print(f"Warning: Couldn't write {len(records)} interactions. Error: {e}")
+
+    def _run(self):
+        conn = connect(self.db_path)
+        try:
+            while True:
+                batch = self._next_batch()
+                stop = batch[-1] is _STOP
+                records = batch[:-1] if stop else batch
+                if records:
+                    self._write(conn, records)
+                for _ in batch:
+                    self._queue.task_done()
+                if stop:
+                    break
+        finally:
+            conn.close()
+
+
+# Shared writer, created on first use and flushed when the process exits
+_interaction_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_interaction_writer():
+    """Get the process-wide interaction writer (database.interaction_writer config)"""
+    global _interaction_writer
+
+    with _writer_lock:
+        if _interaction_writer is None:
+            config = get_config()
+            writer_config = config['database'].get('interaction_writer') or {}
+            _interaction_writer = InteractionWriter(
+                config['database']['path'],
+                batch_size=writer_config.get('batch_size', 50),
+                flush_interval=writer_config.get('flush_interval_seconds', 1.0),
+                max_queue=writer_config.get('max_queue', 1000),
+                put_timeout=writer_config.get('put_timeout_seconds', 5.0)
+            )
+            atexit.register(_interaction_writer.close)
+
+    return _interaction_writer
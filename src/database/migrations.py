@@ -0,0 +1,380 @@
+"""
+Versioned schema migrations
+
+The database's PRAGMA user_version is the number of migrations applied.
+Each migration runs in its own transaction together with the version
+bump, so a database is never left half-migrated. A migration step is an
+SQL statement or a function called with the connection, for changes SQL
+alone can't make. Add new migrations to the end of MIGRATIONS; never
+edit one that has shipped.
+"""
+
+import threading
+from src.database.connection import connect
+from src.database.db_init import create_interactions_table
+from src.database.interaction_writer import normalize_query_text
+
+# Full-text search: (FTS table, content table, indexed columns)
+FTS_INDEXES = [
+    ('faqs_fts', 'faqs', ['question', 'answer']),
+    ('complaints_fts', 'complaints', ['issue_type', 'description', 'solution']),
+    ('products_fts', 'products', ['name', 'category', 'description']),
+    ('interactions_fts', 'interactions', ['query', 'response']),
+]
+
+
+def _fts_statements(fts_table, table, columns):
+    """
+    An external-content FTS5 index over table (no second copy of the text)
+    and the triggers that keep it in sync
+    """
+    cols = ", ".join(columns)
+    new = ", ".join(f"NEW.{c}" for c in columns)
+    old = ", ".join(f"OLD.{c}" for c in columns)
+    delete = (f"INSERT INTO {fts_table} ({fts_table}, rowid, {cols}) "
+              f"VALUES ('delete', OLD.id, {old});")
+    insert = f"INSERT INTO {fts_table} (rowid, {cols}) VALUES (NEW.id, {new});"
+    return [
+        f"CREATE VIRTUAL TABLE {fts_table} USING fts5("
+        f"{cols}, content='{table}', content_rowid='id', "
+        f"tokenize='porter unicode61')",
+        f"INSERT INTO {fts_table} ({fts_table}) VALUES ('rebuild')",
+        f"CREATE TRIGGER {fts_table}_insert AFTER INSERT ON {table} BEGIN {insert} END",
+        f"CREATE TRIGGER {fts_table}_delete AFTER DELETE ON {table} BEGIN {delete} END",
+        # Only text changes touch the index, e.g. not interaction feedback
+        f"CREATE TRIGGER {fts_table}_update AFTER UPDATE OF {cols} ON {table} "
+        f"BEGIN {delete} {insert} END",
+    ]
+
+
+# Upper bounds (ms) of the stage latency histogram buckets, 25% apart from
+# 1 ms to about 11 minutes, then one bucket for anything slower (9e999 is
+# infinity in SQLite). Percentiles read from them are at most 25% high.
+LATENCY_BUCKETS_MS = [round(1.25 ** i, 2) for i in range(61)]
+
+# (stage, ms) for every span of a trace, plus the whole turn as 'total'
+_TRACE_SAMPLES = """
+    SELECT key AS stage, value AS ms FROM json_each({trace}, '$.spans')
+    UNION ALL
+    SELECT 'total', json_extract({trace}, '$.total_ms')
+"""
+
+# The histogram bucket of a latency sample
+_LATENCY_BUCKET = "(SELECT min(upper_ms) FROM latency_buckets WHERE upper_ms >= ms)"
+
+# trace_daily columns and what a single trace adds to them
+_TRACE_TOTALS = [
+    ('turns', "1"),
+    ('prompt_tokens', "coalesce(json_extract({trace}, '$.attributes.prompt_tokens'), 0)"),
+    ('prompt_token_turns', "json_extract({trace}, '$.attributes.prompt_tokens') IS NOT NULL"),
+    ('completion_tokens', "coalesce(json_extract({trace}, '$.attributes.completion_tokens'), 0)"),
+    ('completion_token_turns', "json_extract({trace}, '$.attributes.completion_tokens') IS NOT NULL"),
+    ('cache_hits', "coalesce(json_extract({trace}, '$.attributes.response_cache_hit'), 0) != 0"),
+]
+
+
+def _trace_totals(trace, template):
+    """Join template.format(column=..., value=...) over the trace_daily totals"""
+    return ", ".join(template.format(column=column, value=value.format(trace=trace))
+                     for column, value in _TRACE_TOTALS)
+
+
+def _add_trace_column(conn):
+    """Per-turn trace JSON; logs created by older versions may already have it"""
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(interactions)')]
+    if 'trace' not in columns:
+        conn.execute('ALTER TABLE interactions ADD COLUMN trace TEXT')
+
+
+# (version, description, statements)
+MIGRATIONS = [
+    (1, "Add the product and complaint fields from schema.py and interaction traces", [
+        'ALTER TABLE products ADD COLUMN price REAL',
+        'ALTER TABLE products ADD COLUMN launch_date TEXT',
+        'ALTER TABLE complaints ADD COLUMN frequency INTEGER',
+        _add_trace_column,
+    ]),
+    (2, "Index product lookups and interaction time ranges", [
+        # get_complaints_by_product / get_faqs_by_product; frequency lets
+        # "most common issues for a product" read the index in order
+        'CREATE INDEX IF NOT EXISTS idx_complaints_product '
+        'ON complaints (product_id, frequency)',
+        'CREATE INDEX IF NOT EXISTS idx_faqs_product ON faqs (product_id)',
+        # Covering index for the analytics counts and feedback breakdown
+        # over a timestamp range
+        'CREATE INDEX IF NOT EXISTS idx_interactions_timestamp_feedback '
+        'ON interactions (timestamp, feedback)',
+    ]),
+    (3, "Daily/hourly interaction rollups maintained by triggers", [
+        # Written by the interaction writer; older rows are backfilled with
+        # the same normalisation (normalize_query is registered by migrate())
+        'ALTER TABLE interactions ADD COLUMN normalized_query TEXT',
+        'UPDATE interactions SET normalized_query = normalize_query(query)',
+        '''
+        CREATE TABLE interaction_daily (
+            day TEXT PRIMARY KEY,  -- YYYY-MM-DD (UTC)
+            interactions INTEGER NOT NULL,
+            query_chars INTEGER NOT NULL,
+            positive INTEGER NOT NULL,
+            negative INTEGER NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE interaction_hourly (
+            hour TEXT PRIMARY KEY,  -- YYYY-MM-DD HH:00:00 (UTC)
+            interactions INTEGER NOT NULL,
+            query_chars INTEGER NOT NULL,
+            positive INTEGER NOT NULL,
+            negative INTEGER NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE query_daily (
+            day TEXT NOT NULL,
+            query TEXT NOT NULL,  -- normalized_query
+            count INTEGER NOT NULL,
+            PRIMARY KEY (day, query)
+        )
+        ''',
+        # Backfill from the existing history, once
+        '''
+        INSERT INTO interaction_daily
+        SELECT substr(timestamp, 1, 10), COUNT(*), SUM(coalesce(length(query), 0)),
+               SUM(feedback IS 'positive'), SUM(feedback IS 'negative')
+        FROM interactions GROUP BY 1
+        ''',
+        '''
+        INSERT INTO interaction_hourly
+        SELECT substr(timestamp, 1, 13) || ':00:00', COUNT(*), SUM(coalesce(length(query), 0)),
+               SUM(feedback IS 'positive'), SUM(feedback IS 'negative')
+        FROM interactions GROUP BY 1
+        ''',
+        '''
+        INSERT INTO query_daily
+        SELECT substr(timestamp, 1, 10), normalized_query, COUNT(*)
+        FROM interactions WHERE normalized_query IS NOT NULL GROUP BY 1, 2
+        ''',
+        # Keep the rollups current as interactions are written
+        '''
+        CREATE TRIGGER interactions_rollup_insert AFTER INSERT ON interactions
+        BEGIN
+            INSERT INTO interaction_daily (day, interactions, query_chars, positive, negative)
+            VALUES (substr(NEW.timestamp, 1, 10), 1, coalesce(length(NEW.query), 0),
+                    NEW.feedback IS 'positive', NEW.feedback IS 'negative')
+            ON CONFLICT (day) DO UPDATE SET
+                interactions = interactions + 1,
+                query_chars = query_chars + excluded.query_chars,
+                positive = positive + excluded.positive,
+                negative = negative + excluded.negative;
+
+            INSERT INTO interaction_hourly (hour, interactions, query_chars, positive, negative)
+            VALUES (substr(NEW.timestamp, 1, 13) || ':00:00', 1, coalesce(length(NEW.query), 0),
+                    NEW.feedback IS 'positive', NEW.feedback IS 'negative')
+            ON CONFLICT (hour) DO UPDATE SET
+                interactions = interactions + 1,
+                query_chars = query_chars + excluded.query_chars,
+                positive = positive + excluded.positive,
+                negative = negative + excluded.negative;
+
+            INSERT INTO query_daily (day, query, count)
+            SELECT substr(NEW.timestamp, 1, 10), NEW.normalized_query, 1
+            WHERE NEW.normalized_query IS NOT NULL
+            ON CONFLICT (day, query) DO UPDATE SET count = count + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER interactions_rollup_feedback AFTER UPDATE OF feedback ON interactions
+        BEGIN
+            UPDATE interaction_daily SET
+                positive = positive + (NEW.feedback IS 'positive') - (OLD.feedback IS 'positive'),
+                negative = negative + (NEW.feedback IS 'negative') - (OLD.feedback IS 'negative')
+            WHERE day = substr(NEW.timestamp, 1, 10);
+
+            UPDATE interaction_hourly SET
+                positive = positive + (NEW.feedback IS 'positive') - (OLD.feedback IS 'positive'),
+                negative = negative + (NEW.feedback IS 'negative') - (OLD.feedback IS 'negative')
+            WHERE hour = substr(NEW.timestamp, 1, 13) || ':00:00';
+        END
+        ''',
+        '''
+        CREATE TRIGGER interactions_rollup_delete AFTER DELETE ON interactions
+        BEGIN
+            UPDATE interaction_daily SET
+                interactions = interactions - 1,
+                query_chars = query_chars - coalesce(length(OLD.query), 0),
+                positive = positive - (OLD.feedback IS 'positive'),
+                negative = negative - (OLD.feedback IS 'negative')
+            WHERE day = substr(OLD.timestamp, 1, 10);
+
+            UPDATE interaction_hourly SET
+                interactions = interactions - 1,
+                query_chars = query_chars - coalesce(length(OLD.query), 0),
+                positive = positive - (OLD.feedback IS 'positive'),
+                negative = negative - (OLD.feedback IS 'negative')
+            WHERE hour = substr(OLD.timestamp, 1, 13) || ':00:00';
+
+            UPDATE query_daily SET count = count - 1
+            WHERE day = substr(OLD.timestamp, 1, 10) AND query = OLD.normalized_query;
+        END
+        ''',
+    ]),
+    (4, "Full-text search over the knowledge base and interactions",
+     [statement for index in FTS_INDEXES for statement in _fts_statements(*index)]),
+    (5, "Per-stage latency histograms and trace totals maintained by triggers", [
+        'CREATE TABLE latency_buckets (upper_ms REAL PRIMARY KEY)',
+        'INSERT INTO latency_buckets VALUES '
+        + ', '.join(f'({bucket})' for bucket in LATENCY_BUCKETS_MS) + ', (9e999)',
+        '''
+        CREATE TABLE stage_latency_daily (
+            day TEXT NOT NULL,
+            stage TEXT NOT NULL,  -- trace span name, or 'total'
+            upper_ms REAL NOT NULL,  -- latency_buckets bucket
+            count INTEGER NOT NULL,
+            PRIMARY KEY (day, stage, upper_ms)
+        )
+        ''',
+        '''
+        CREATE TABLE trace_daily (
+            day TEXT PRIMARY KEY,
+            turns INTEGER NOT NULL,
+            prompt_tokens INTEGER NOT NULL,
+            prompt_token_turns INTEGER NOT NULL,  -- turns that recorded prompt_tokens
+            completion_tokens INTEGER NOT NULL,
+            completion_token_turns INTEGER NOT NULL,
+            cache_hits INTEGER NOT NULL
+        )
+        ''',
+        # Backfill from the traces stored so far, once
+        f'''
+        INSERT INTO stage_latency_daily
+        SELECT day, stage, {_LATENCY_BUCKET}, COUNT(*)
+        FROM (
+            SELECT substr(i.timestamp, 1, 10) AS day, s.key AS stage, s.value AS ms
+            FROM interactions AS i, json_each(
+                CASE WHEN json_valid(i.trace) THEN i.trace END, '$.spans') AS s
+            UNION ALL
+            SELECT substr(timestamp, 1, 10), 'total', json_extract(trace, '$.total_ms')
+            FROM interactions WHERE json_valid(trace)
+        )
+        WHERE ms IS NOT NULL
+        GROUP BY 1, 2, 3
+        ''',
+        f'''
+        INSERT INTO trace_daily
+        SELECT substr(timestamp, 1, 10), {_trace_totals('trace', 'SUM({value})')}
+        FROM interactions WHERE json_valid(trace)
+        GROUP BY 1
+        ''',
+        # Keep them current as traced interactions are written
+        f'''
+        CREATE TRIGGER interactions_trace_insert AFTER INSERT ON interactions
+        WHEN json_valid(NEW.trace)
+        BEGIN
+            INSERT INTO stage_latency_daily (day, stage, upper_ms, count)
+            SELECT substr(NEW.timestamp, 1, 10), stage, {_LATENCY_BUCKET}, 1
+            FROM ({_TRACE_SAMPLES.format(trace='NEW.trace')})
+            WHERE ms IS NOT NULL
+            ON CONFLICT (day, stage, upper_ms) DO UPDATE SET count = count + 1;
+
+            INSERT INTO trace_daily
+            VALUES (substr(NEW.timestamp, 1, 10), {_trace_totals('NEW.trace', '{value}')})
+            ON CONFLICT (day) DO UPDATE SET
+                {_trace_totals('NEW.trace', '{column} = {column} + excluded.{column}')};
+        END
+        ''',
+        f'''
+        CREATE TRIGGER interactions_trace_delete AFTER DELETE ON interactions
+        WHEN json_valid(OLD.trace)
+        BEGIN
+            UPDATE stage_latency_daily SET count = count - 1
+            WHERE day = substr(OLD.timestamp, 1, 10) AND (stage, upper_ms) IN (
+                SELECT stage, {_LATENCY_BUCKET}
+                FROM ({_TRACE_SAMPLES.format(trace='OLD.trace')})
+                WHERE ms IS NOT NULL);
+
+            UPDATE trace_daily SET
+                {_trace_totals('OLD.trace', '{column} = {column} - ({value})')}
+            WHERE day = substr(OLD.timestamp, 1, 10);
+        END
+        ''',
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn, target=LATEST_VERSION):
+    """
+    Apply pending migrations up to target
+    Returns the versions applied
+    """
+    # SQL functions the migrations use
+    conn.create_function('normalize_query', 1, normalize_query_text,
+                         deterministic=True)
+
+    applied = []
+    for version, description, statements in MIGRATIONS:
+        if version > target:
+            break
+        if version <= get_schema_version(conn):
+            continue
+
+        # Take the write lock first, then re-check in case another
+        # process migrated in the meantime
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if version <= get_schema_version(conn):
+                conn.rollback()
+                continue
+            for statement in statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {int(version)}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+
+    return applied
+
+
+def migrate_database(db_path=None):
+    """Bring the configured database up to date, e.g. at app startup"""
+    conn = connect(db_path)
+    try:
+        # Databases from before the interaction log was created at startup
+        # may not have the table the indexes need
+        create_interactions_table(conn.cursor())
+        conn.commit()
+        return migrate(conn)
+    finally:
+        conn.close()
+
+
+_migrated = False
+_migrate_lock = threading.Lock()
+
+
+def ensure_migrated():
+    """Run migrate_database() once per process"""
+    global _migrated
+
+    with _migrate_lock:
+        if not _migrated:
+            migrate_database()
+            _migrated = True
+
+
+if __name__ == "__main__":
+    applied = migrate_database()
+    if applied:
+        print(f"Applied migrations: {', '.join(str(v) for v in applied)}")
+    else:
+        print(f"Database is up to date (version {LATEST_VERSION})")
@@ -2,23 +2,88 @@
 Functions for querying the database
 """
 
-import sqlite3
-import json
-from src.utils.config import get_config
+import re
+import threading
+from itertools import groupby
+from src.database.connection import connect, get_connection
+from src.database.db_init import create_change_tracking
+from src.database.interaction_writer import get_interaction_writer
+
+# Full-text search sources: FTS table, content table and result type
+SEARCH_SOURCES = {
+    'faqs': ('faqs_fts', 'faqs', 'faq'),
+    'complaints': ('complaints_fts', 'complaints', 'complaint'),
+    'products': ('products_fts', 'products', 'product'),
+    'interactions': ('interactions_fts', 'interactions', 'interaction'),
+}
+KNOWLEDGE_BASE_SOURCES = ('faqs', 'complaints', 'products')
+
+# Process-wide knowledge base snapshot, shared by all sessions
+_kb_snapshot = None
+_kb_data_version = None
+_kb_watch_conn = None
+_kb_lock = threading.Lock()
 
 
 def get_db_connection():
-    """Get a connection to the SQLite database"""
-    config = get_config()
-    db_path = config['database']['path']
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """
+    Get the calling thread's pooled connection to the SQLite database
+    The pool owns it: don't close it
+    """
+    return get_connection()
+
+
+def open_db_connection():
+    """
+    Open a new connection to the SQLite database that the caller owns and
+    must close; it may be used from any thread (one at a time)
+    """
+    return connect(check_same_thread=False)
 
 
 def get_knowledge_base():
-    """Get all knowledge base items"""
-    conn = get_db_connection()
+    """
+    Get all knowledge base items
+    Returns the shared snapshot, reloaded only when the products, complaints
+    or faqs tables change. The 'version' key identifies the snapshot so
+    derived structures can be rebuilt only when it changes. Treat the
+    result as read-only.
+    """
+    global _kb_snapshot, _kb_data_version, _kb_watch_conn
+
+    with _kb_lock:
+        if _kb_watch_conn is None:
+            _kb_watch_conn = open_db_connection()
+            create_change_tracking(_kb_watch_conn.cursor())
+            _kb_watch_conn.commit()
+
+        # data_version only changes when another connection commits
+        data_version = _kb_watch_conn.execute(
+            'PRAGMA data_version').fetchone()[0]
+        if _kb_snapshot is not None and data_version == _kb_data_version:
+            return _kb_snapshot
+        _kb_data_version = data_version
+
+        # Something was committed, check whether it touched the knowledge base
+        kb_version = _kb_watch_conn.execute(
+            'SELECT version FROM kb_version WHERE id = 1').fetchone()[0]
+        if _kb_snapshot is not None and kb_version == _kb_snapshot['version']:
+            return _kb_snapshot
+
+        _kb_snapshot = load_knowledge_base(_kb_watch_conn)
+        _kb_snapshot['version'] = kb_version
+        return _kb_snapshot
+
+
+def get_knowledge_base_version():
+    """Get the version of the current knowledge base snapshot"""
+    return get_knowledge_base()['version']
+
+
+def load_knowledge_base(conn=None):
+    """Read all knowledge base items from the database"""
+    if conn is None:
+        conn = get_db_connection()
     cursor = conn.cursor()
 
     # Get products
@@ -33,8 +98,6 @@ def get_knowledge_base():
     cursor.execute('SELECT * FROM faqs')
     faqs = [dict(row) for row in cursor.fetchall()]
 
-    conn.close()
-
     return {
         'products': products,
         'complaints': complaints,
@@ -50,8 +113,6 @@ def get_product_by_id(product_id):
     cursor.execute('SELECT * FROM products WHERE id = ?', (product_id,))
     product = cursor.fetchone()
 
-    conn.close()
-
     return dict(product) if product else None
 
 
@@ -64,8 +125,6 @@ def get_complaints_by_product(product_id):
         'SELECT * FROM complaints WHERE product_id = ?', (product_id,))
     complaints = [dict(row) for row in cursor.fetchall()]
 
-    conn.close()
-
     return complaints
 
 
@@ -77,32 +136,176 @@ def get_faqs_by_product(product_id):
     cursor.execute('SELECT * FROM faqs WHERE product_id = ?', (product_id,))
     faqs = [dict(row) for row in cursor.fetchall()]
 
-    conn.close()
-
     return faqs
 
 
-def log_interaction(user_query, response, feedback=None):
-    """Log user interaction for analysis"""
+def log_interaction(user_query, response, feedback=None, trace=None):
+    """
+    Log user interaction for analysis
+    trace is an optional dict of per-stage timings stored as JSON with the row
+    The row is written in the background by the interaction writer
+    """
+    get_interaction_writer().submit(user_query, response, feedback, trace)
+
+
+def flush_interactions():
+    """Wait until all logged interactions have been written"""
+    get_interaction_writer().flush()
+
+
+def get_interaction_stats(start, end=None, by='day'):
+    """
+    Get interaction counts, average query length and feedback per day (or
+    per hour with by='hour') from the rollup tables, for start <= period <
+    end. start and end are 'YYYY-MM-DD' strings (or 'YYYY-MM-DD HH:00:00')
+    """
+    table, column = {
+        'day': ('interaction_daily', 'day'),
+        'hour': ('interaction_hourly', 'hour')
+    }[by]
     conn = get_db_connection()
-    cursor = conn.cursor()
 
-    # Create interactions table if it doesn't exist
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS interactions (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-        query TEXT,
-        response TEXT,
-        feedback TEXT
-    )
-    ''')
-
-    # Insert new interaction
-    cursor.execute(
-        'INSERT INTO interactions (query, response, feedback) VALUES (?, ?, ?)',
-        (user_query, response, feedback)
-    )
+    rows = conn.execute(f'''
+    SELECT
+        {column} AS period,
+        interactions AS interaction_count,
+        CAST(query_chars AS REAL) / interactions AS avg_query_length,
+        positive AS positive_feedback,
+        negative AS negative_feedback
+    FROM {table}
+    WHERE {column} >= ? AND {column} < ? AND interactions > 0
+    ORDER BY {column}
+    ''', (start, end or '9999')).fetchall()
+
+    return [dict(row) for row in rows]
+
+
+def get_top_queries(start, end=None, limit=10):
+    """Get the most frequent normalised queries for start <= day < end"""
+    conn = get_db_connection()
+
+    rows = conn.execute('''
+    SELECT query, SUM(count) AS count
+    FROM query_daily
+    WHERE day >= ? AND day < ?
+    GROUP BY query
+    HAVING SUM(count) > 0
+    ORDER BY count DESC
+    LIMIT ?
+    ''', (start, end or '9999', limit)).fetchall()
+
+    return [dict(row) for row in rows]
+
+
+def get_stage_latency(start, end=None, quantiles=(0.5, 0.95, 0.99), by_day=False):
+    """
+    Get latency percentiles (ms) per pipeline stage, and per day with
+    by_day=True, from the latency histograms for start <= day < end.
+    Each percentile is the upper bound of the histogram bucket it falls in,
+    so it is at most 25% high. Keys: 'stage', 'day' (if by_day), 'samples'
+    and 'p50', 'p95', ... for the quantiles
+    """
+    group = ['day', 'stage'] if by_day else ['stage']
+    columns = ", ".join(group)
+    conn = get_db_connection()
+
+    rows = conn.execute(f'''
+    SELECT {columns}, upper_ms, SUM(count) AS count
+    FROM stage_latency_daily
+    WHERE day >= ? AND day < ?
+    GROUP BY {columns}, upper_ms
+    HAVING SUM(count) > 0
+    ORDER BY {columns}, upper_ms
+    ''', (start, end or '9999')).fetchall()
+
+    # Walk each group's buckets in order until the quantile's rank is reached
+    stats = []
+    for key, group_rows in groupby(rows, key=lambda row: tuple(row[c] for c in group)):
+        buckets = [(row['upper_ms'], row['count']) for row in group_rows]
+        samples = sum(count for _, count in buckets)
+        entry = dict(zip(group, key), samples=samples)
+        for quantile in quantiles:
+            seen = 0
+            for upper_ms, count in buckets:
+                seen += count
+                if seen >= quantile * samples:
+                    break
+            entry[f"p{quantile * 100:g}"] = upper_ms
+        stats.append(entry)
+
+    return stats
+
+
+def get_trace_stats(start, end=None):
+    """
+    Get traced turn totals for start <= day < end: turns, average prompt
+    and completion tokens (over the turns that recorded them) and the share
+    of turns answered from the response cache
+    """
+    conn = get_db_connection()
+
+    row = conn.execute('''
+    SELECT
+        SUM(turns) AS turns,
+        CAST(SUM(prompt_tokens) AS REAL) / NULLIF(SUM(prompt_token_turns), 0)
+            AS avg_prompt_tokens,
+        CAST(SUM(completion_tokens) AS REAL) / NULLIF(SUM(completion_token_turns), 0)
+            AS avg_completion_tokens,
+        CAST(SUM(cache_hits) AS REAL) / NULLIF(SUM(turns), 0) AS cache_hit_rate
+    FROM trace_daily
+    WHERE day >= ? AND day < ?
+    ''', (start, end or '9999')).fetchone()
+
+    stats = dict(row)
+    stats['turns'] = stats['turns'] or 0
+    return stats
+
+
+def to_fts_query(text, match_all=False):
+    """
+    Turn free text into an FTS5 query: every word quoted (so user input
+    can't inject FTS syntax), joined with OR, or AND if match_all
+    """
+    terms = re.findall(r"\w+", text.lower())
+    return f" {'AND' if match_all else 'OR'} ".join(f'"{term}"' for term in terms)
+
+
+def search(text, sources=KNOWLEDGE_BASE_SOURCES, limit=10, match_all=False):
+    """
+    Full-text search over the given sources (see SEARCH_SOURCES)
+    Returns up to limit results, best first, as dicts with 'type', 'id',
+    'score' (negated BM25, higher is better), 'snippet' and the row as 'data'.
+    BM25 scores are merged across sources as they are, which is good
+    enough to rank but not strictly comparable between tables.
+    """
+    fts_query = to_fts_query(text, match_all)
+    if not fts_query:
+        return []
+    conn = get_db_connection()
+
+    results = []
+    for source in sources:
+        fts_table, table, result_type = SEARCH_SOURCES[source]
+        rows = conn.execute(f'''
+        SELECT {table}.*,
+            -bm25({fts_table}) AS fts_score,
+            snippet({fts_table}, -1, '**', '**', '…', 16) AS fts_snippet
+        FROM {fts_table}
+        JOIN {table} ON {table}.id = {fts_table}.rowid
+        WHERE {fts_table} MATCH ?
+        ORDER BY bm25({fts_table})
+        LIMIT ?
+        ''', (fts_query, limit)).fetchall()
+
+        for row in rows:
+            data = dict(row)
+            results.append({
+                'type': result_type,
+                'id': data['id'],
+                'score': data.pop('fts_score'),
+                'snippet': data.pop('fts_snippet'),
+                'data': data
+            })
 
-    conn.commit()
-    conn.close()
+    results.sort(key=lambda result: result['score'], reverse=True)
+    return results[:limit]
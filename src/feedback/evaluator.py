@@ -1,3 +1,7 @@
+from src.utils.tracing import traced
+
+
+@traced('evaluate')
 def evaluate_response(query, response):
     """Evaluate and potentially improve a response"""
     # This is a simplified version of the self-rewarding mechanism
@@ -21,3 +25,19 @@ def evaluate_response(query, response):
         response += " I recommend checking your system documentation for model-specific instructions or contacting your maintenance team if the issue persists."
 
     return response
+
+
+def evaluate_response_stream(query, chunks):
+    """
+    Pass streamed response chunks through unchanged, then yield whatever
+    evaluate_response adds once the full response is known
+    """
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+
+    response = "".join(parts)
+    improved = evaluate_response(query, response)
+    if len(improved) > len(response):
+        yield improved[len(response):]
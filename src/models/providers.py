@@ -0,0 +1,410 @@
+"""
+Async LLM providers with pooled keep-alive connections
+
+Each provider owns one httpx.AsyncClient (connection pool) and limits how
+many requests it has in flight. Requests take an optional timeout and can
+be cancelled like any asyncio task. The sync helpers at the bottom run
+the providers on a shared background event loop so Streamlit sessions can
+use them without each holding its own connections.
+"""
+
+import asyncio
+import json
+import os
+import queue
+import threading
+import httpx
+from src.utils.config import get_config
+from src.utils.tracing import current_trace
+
+SYSTEM_PROMPT = "You are an industrial support assistant."
+
+
+class ProviderError(Exception):
+    """A failed LLM request; retryable errors may succeed if tried again"""
+    retryable = False
+
+    def __init__(self, message, provider=None, status=None, retry_after=None):
+        super().__init__(message)
+        self.provider = provider
+        self.status = status
+        self.retry_after = retry_after
+
+
+class RateLimitError(ProviderError):
+    retryable = True
+
+
+class ServerError(ProviderError):
+    retryable = True
+
+
+class ProviderTimeout(ProviderError):
+    retryable = True
+
+
+class ConnectionFailed(ProviderError):
+    retryable = True
+
+
+class RequestRejected(ProviderError):
+    """4xx other than 429, e.g. a bad API key or model name"""
+
+
+class BadResponse(ProviderError):
+    """The provider answered with something we couldn't parse"""
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_error(error, provider=None):
+    """Map a transport/HTTP/parse exception to a ProviderError"""
+    if isinstance(error, ProviderError):
+        return error
+    detail = str(error) or type(error).__name__
+    message = f"{provider}: {detail}" if provider else detail
+    if isinstance(error, (asyncio.TimeoutError, httpx.TimeoutException)):
+        return ProviderTimeout(message, provider)
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        if status == 429:
+            return RateLimitError(message, provider, status,
+                                  _retry_after(error.response))
+        if status >= 500:
+            return ServerError(message, provider, status)
+        return RequestRejected(message, provider, status)
+    if isinstance(error, httpx.TransportError):
+        return ConnectionFailed(message, provider)
+    if isinstance(error, (ValueError, KeyError, IndexError, TypeError)):
+        return BadResponse(message, provider)
+    return ProviderError(message, provider)
+
+
+class AsyncLLMProvider:
+    name = None
+
+    def __init__(self, model_id, base_url, api_key=None, temperature=0.5,
+                 max_tokens=1024, timeout=60.0, max_concurrency=8,
+                 max_connections=20):
+        self.model_id = model_id
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.max_connections = max_connections
+
+        # Created on first use, inside the event loop that will use them
+        self._client = None
+        self._semaphore = None
+
+    def _headers(self):
+        return {}
+
+    def _get_client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self._headers(),
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections))
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    async def generate(self, prompt, timeout=None, on_usage=None, **options):
+        """
+        Generate a complete response
+        on_usage(prompt_tokens, completion_tokens) is called when the
+        provider reports token counts
+        """
+        client = self._get_client()
+        try:
+            # Waiting for a free slot counts toward the timeout
+            return await asyncio.wait_for(
+                self._limited_generate(client, prompt, on_usage, **options),
+                timeout or self.timeout)
+        except Exception as e:
+            raise classify_error(e, self.name) from e
+
+    async def _limited_generate(self, client, prompt, on_usage, **options):
+        async with self._semaphore:
+            return await self._generate(client, prompt, on_usage, **options)
+
+    async def stream(self, prompt, timeout=None, on_usage=None, **options):
+        """Generate a response as an async iterator of text chunks"""
+        client = self._get_client()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.timeout)
+
+        # Waiting for a free slot counts toward the timeout
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), deadline - loop.time())
+        except Exception as e:
+            raise classify_error(e, self.name) from e
+
+        try:
+            chunks = self._stream(client, prompt, on_usage, **options)
+            try:
+                while True:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        raise ProviderTimeout(f"{self.name}: timed out", self.name)
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), remaining)
+                    except StopAsyncIteration:
+                        break
+                    yield chunk
+            except Exception as e:
+                raise classify_error(e, self.name) from e
+            finally:
+                await chunks.aclose()
+        finally:
+            self._semaphore.release()
+
+    async def aclose(self):
+        """Close pooled connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _generate(self, client, prompt, on_usage, **options):
+        raise NotImplementedError
+
+    async def _stream(self, client, prompt, on_usage, **options):
+        raise NotImplementedError
+        yield
+
+
+class OllamaProvider(AsyncLLMProvider):
+    name = 'ollama'
+
+    def _payload(self, prompt, stream, options):
+        return {
+            "model": self.model_id,
+            "prompt": prompt,
+            "stream": stream,
+            "options": {
+                "num_predict": options.get('max_tokens', self.max_tokens),
+                "temperature": options.get('temperature', self.temperature)
+            }
+        }
+
+    @staticmethod
+    def _report_usage(result, on_usage):
+        if on_usage and 'eval_count' in result:
+            on_usage(result.get('prompt_eval_count'), result['eval_count'])
+
+    async def _generate(self, client, prompt, on_usage, **options):
+        response = await client.post(
+            "/api/generate", json=self._payload(prompt, False, options))
+        response.raise_for_status()
+        result = response.json()
+        self._report_usage(result, on_usage)
+        return result.get('response', '')
+
+    async def _stream(self, client, prompt, on_usage, **options):
+        async with client.stream(
+                "POST", "/api/generate",
+                json=self._payload(prompt, True, options)) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get('response'):
+                    yield chunk['response']
+                if chunk.get('done', False):
+                    self._report_usage(chunk, on_usage)
+                    break
+
+
+class GroqProvider(AsyncLLMProvider):
+    """Groq through its OpenAI-compatible chat completions endpoint"""
+    name = 'groq'
+
+    def _headers(self):
+        # Read the environment per request, so a key saved on the settings
+        # page applies to the shared provider too
+        api_key = self.api_key or os.environ.get('GROQ_API_KEY')
+        return {"Authorization": f"Bearer {api_key}"} if api_key else {}
+
+    def _payload(self, prompt, stream, options):
+        return {
+            "model": self.model_id,
+            "messages": [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": options.get('temperature', self.temperature),
+            "max_tokens": options.get('max_tokens', self.max_tokens),
+            "stream": stream
+        }
+
+    @staticmethod
+    def _report_usage(usage, on_usage):
+        if on_usage and usage:
+            on_usage(usage.get('prompt_tokens'), usage.get('completion_tokens'))
+
+    async def _generate(self, client, prompt, on_usage, **options):
+        response = await client.post(
+            "/openai/v1/chat/completions",
+            json=self._payload(prompt, False, options))
+        response.raise_for_status()
+        result = response.json()
+        self._report_usage(result.get('usage'), on_usage)
+        return result['choices'][0]['message']['content']
+
+    async def _stream(self, client, prompt, on_usage, **options):
+        async with client.stream(
+                "POST", "/openai/v1/chat/completions",
+                json=self._payload(prompt, True, options)) as response:
+            response.raise_for_status()
+            # Server-sent events: "data: {...}" lines, ending with "data: [DONE]"
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                # Groq reports usage on the final chunk
+                self._report_usage(
+                    (chunk.get('x_groq') or {}).get('usage'), on_usage)
+                if chunk.get('choices'):
+                    content = chunk['choices'][0].get('delta', {}).get('content')
+                    if content:
+                        yield content
+
+
+PROVIDER_TYPES = {
+    'groq': GroqProvider,
+    'ollama': OllamaProvider
+}
+
+_DEFAULT_MODEL_IDS = {
+    'groq': 'llama3-8b-8192',
+    'ollama': 'llama3:latest'
+}
+
+_DEFAULT_BASE_URLS = {
+    'groq': 'https://api.groq.com',
+    'ollama': 'http://localhost:11434'
+}
+
+
+def create_provider(name, config=None):
+    """Create a provider from the models.<name> config section"""
+    config = config or get_config()
+    model_config = config['models'].get(name) or {}
+    nlp_config = config.get('nlp') or {}
+    pool_config = config['models'].get('connection_pool') or {}
+
+    return PROVIDER_TYPES[name](
+        model_id=model_config.get('model_id', _DEFAULT_MODEL_IDS[name]),
+        base_url=model_config.get('base_url', _DEFAULT_BASE_URLS[name]),
+        api_key=model_config.get('api_key'),
+        temperature=model_config.get('temperature', nlp_config.get('temperature', 0.5)),
+        max_tokens=model_config.get('max_tokens', nlp_config.get('max_tokens', 1024)),
+        timeout=pool_config.get('timeout_seconds', 60.0),
+        max_concurrency=pool_config.get('max_concurrent_requests', 8),
+        max_connections=pool_config.get('max_connections', 20)
+    )
+
+
+# Shared event loop and providers for sync callers
+_loop = None
+_providers = {}
+_runtime_lock = threading.Lock()
+
+
+def get_event_loop():
+    """Get the background event loop that runs provider requests"""
+    global _loop
+
+    with _runtime_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever,
+                             name="llm-event-loop", daemon=True).start()
+    return _loop
+
+
+def get_provider(name=None):
+    """Get the shared provider by name, defaulting to models.default"""
+    name = name or get_config()['models'].get('default', 'groq')
+    with _runtime_lock:
+        if name not in _providers:
+            _providers[name] = create_provider(name)
+        return _providers[name]
+
+
+def _usage_recorder():
+    """Record token counts in the caller's trace from the event loop thread"""
+    trace = current_trace()
+    if trace is None:
+        return None
+
+    def on_usage(prompt_tokens, completion_tokens):
+        trace.record('prompt_tokens', prompt_tokens)
+        trace.record('completion_tokens', completion_tokens)
+    return on_usage
+
+
+def run_coroutine(coroutine):
+    """Run a coroutine on the shared event loop and wait for its result"""
+    future = asyncio.run_coroutine_threadsafe(coroutine, get_event_loop())
+    try:
+        return future.result()
+    except BaseException:
+        # e.g. the caller was interrupted; cancel the request as well
+        future.cancel()
+        raise
+
+
+def run_generate(prompt, provider=None, timeout=None, **options):
+    """Generate a response synchronously on the shared event loop"""
+    provider = provider or get_provider()
+    return run_coroutine(provider.generate(
+        prompt, timeout=timeout, on_usage=_usage_recorder(), **options))
+
+
+def run_stream(prompt, provider=None, timeout=None, **options):
+    """
+    Stream a response synchronously; chunks arrive through a queue from the
+    shared event loop. Closing the generator cancels the request.
+    """
+    provider = provider or get_provider()
+    chunks = queue.Queue()
+    done = object()
+    on_usage = _usage_recorder()
+
+    async def pump():
+        try:
+            async for chunk in provider.stream(
+                    prompt, timeout=timeout, on_usage=on_usage, **options):
+                chunks.put(chunk)
+        except BaseException as e:
+            chunks.put(e)
+            raise
+        finally:
+            chunks.put(done)
+
+    future = asyncio.run_coroutine_threadsafe(pump(), get_event_loop())
+    try:
+        while True:
+            item = chunks.get()
+            if item is done:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        future.cancel()
@@ -0,0 +1,350 @@
+"""
+Retries, circuit breakers and failover across LLM providers
+
+Requests go to the providers in failover order. Retryable errors (rate
+limits, 5xx, timeouts, connection failures) are retried with jittered
+exponential backoff; each provider has a circuit breaker that stops
+sending it traffic for a while after repeated failures, so requests fail
+over to the next provider straight away instead of waiting on a backend
+that is down.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from src.models.providers import (
+    ProviderError, RequestRejected, get_provider, run_generate, run_stream)
+from src.models.single_flight import SingleFlightLLM
+from src.utils.config import get_config
+from src.utils.tracing import current_trace
+
+
+class AllProvidersFailed(ProviderError):
+    """Every provider failed or had its circuit open"""
+
+    def __init__(self, errors):
+        summary = "; ".join(str(e) for e in errors) or "no providers available"
+        super().__init__(f"All LLM providers failed: {summary}")
+        self.errors = errors
+
+
+class CircuitBreaker:
+    """
+    Closed: requests flow and failures are counted. After failure_threshold
+    consecutive failures it opens and rejects requests for reset_seconds,
+    then lets one trial request through (half-open); its outcome closes or
+    re-opens the circuit.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_seconds=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if self.clock() - self.opened_at >= self.reset_seconds:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self):
+        """Whether a request may be sent now"""
+        with self._lock:
+            state = self.state
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+            self._trial_running = False
+
+    def record_rejected(self):
+        """
+        The provider answered but refused the request (4xx): that says
+        nothing about its health, so only end a half-open trial
+        """
+        with self._lock:
+            self._trial_running = False
+
+    def record_cancelled(self):
+        """
+        The request was cancelled (or its stream closed) before an outcome:
+        not a failure, but a half-open trial must end so another can run
+        """
+        with self._lock:
+            self._trial_running = False
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, capped at max_delay"""
+
+    def __init__(self, max_attempts=3, base_delay=0.5, max_delay=8.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt, retry_after=None):
+        """Seconds to wait before retry number attempt (1-based)"""
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class ResilientLLM:
+    """
+    Provider-like object (generate/stream) that adds retries, circuit
+    breakers and failover over the given providers, tried in order
+    on_event(name, value) is called with 'provider', 'retry' and 'failover'
+    events for tracing
+    """
+
+    def __init__(self, providers, retry_policy=None, breakers=None,
+                 deadline_seconds=None):
+        self.providers = list(providers)
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.breakers = breakers or {p.name: CircuitBreaker() for p in self.providers}
+        self.deadline_seconds = deadline_seconds
+
+    def _deadline(self):
+        if self.deadline_seconds is None:
+            return None
+        return time.monotonic() + self.deadline_seconds
+
+    async def _backoff(self, attempt, error, deadline):
+        """Wait before a retry; False if the retry would miss the deadline"""
+        if attempt >= self.retry_policy.max_attempts or not error.retryable:
+            return False
+        delay = self.retry_policy.delay(attempt, error.retry_after)
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return False
+        await asyncio.sleep(delay)
+        return True
+
+    @staticmethod
+    def _record_error(breaker, error):
+        """Count only retryable or server-side failures toward the breaker"""
+        if isinstance(error, RequestRejected):
+            breaker.record_rejected()
+        else:
+            breaker.record_failure()
+
+    async def generate(self, prompt, timeout=None, on_usage=None,
+                       on_event=None, **options):
+        errors = []
+        deadline = self._deadline()
+
+        for index, provider in enumerate(self.providers):
+            breaker = self.breakers[provider.name]
+            if not breaker.allow():
+                errors.append(ProviderError(
+                    f"{provider.name}: circuit open", provider.name))
+                continue
+            if index and on_event:
+                on_event('failover', provider.name)
+
+            attempt = 1
+            try:
+                while True:
+                    try:
+                        result = await provider.generate(
+                            prompt, timeout=timeout, on_usage=on_usage, **options)
+                    except ProviderError as e:
+                        self._record_error(breaker, e)
+                        if breaker.allow() and await self._backoff(attempt, e, deadline):
+                            attempt += 1
+                            if on_event:
+                                on_event('retry', provider.name)
+                            continue
+                        errors.append(e)
+                        break
+                    breaker.record_success()
+                    if on_event:
+                        on_event('provider', provider.name)
+                    return result
+            except BaseException:
+                # Cancelled (CancelledError is a BaseException): release a
+                # half-open trial, or the circuit would never close again
+                breaker.record_cancelled()
+                raise
+
+        raise AllProvidersFailed(errors)
+
+    async def stream(self, prompt, timeout=None, on_usage=None,
+                     on_event=None, **options):
+        """
+        Stream from the first provider that starts answering. Retries and
+        failover only happen before the first chunk; an error after that
+        is raised, since the text so far has already been shown.
+        """
+        errors = []
+        deadline = self._deadline()
+
+        for index, provider in enumerate(self.providers):
+            breaker = self.breakers[provider.name]
+            if not breaker.allow():
+                errors.append(ProviderError(
+                    f"{provider.name}: circuit open", provider.name))
+                continue
+            if index and on_event:
+                on_event('failover', provider.name)
+
+            attempt = 1
+            try:
+                while True:
+                    started = False
+                    try:
+                        async for chunk in provider.stream(
+                                prompt, timeout=timeout, on_usage=on_usage, **options):
+                            if not started:
+                                started = True
+                                if on_event:
+                                    on_event('provider', provider.name)
+                            yield chunk
+                    except ProviderError as e:
+                        self._record_error(breaker, e)
+                        if started:
+                            raise
+                        if breaker.allow() and await self._backoff(attempt, e, deadline):
+                            attempt += 1
+                            if on_event:
+                                on_event('retry', provider.name)
+                            continue
+                        errors.append(e)
+                        break
+                    breaker.record_success()
+                    return
+            except BaseException:
+                # Cancelled, or the stream was closed (GeneratorExit): release
+                # a half-open trial, or the circuit would never close again
+                breaker.record_cancelled()
+                raise
+
+        raise AllProvidersFailed(errors)
+
+    def stats(self):
+        """Circuit state and consecutive failures per provider"""
+        return {name: {'state': breaker.state, 'failures': breaker.failures}
+                for name, breaker in self.breakers.items()}
+
+
+def get_failover_order(config=None):
+    """Provider names in failover order (models.resilience.failover)"""
+    config = config or get_config()
+    resilience_config = config['models'].get('resilience') or {}
+    default = config['models'].get('default', 'groq')
+    order = resilience_config.get('failover')
+    if not order:
+        # The default model first, then the other one
+        order = [default] + [name for name in ('groq', 'ollama') if name != default]
+    return order
+
+
+def create_resilient_llm(config=None):
+    """Build a ResilientLLM from the models.resilience config"""
+    config = config or get_config()
+    resilience_config = config['models'].get('resilience') or {}
+    retry_config = resilience_config.get('retry') or {}
+    breaker_config = resilience_config.get('circuit_breaker') or {}
+
+    providers = [get_provider(name) for name in get_failover_order(config)]
+    return ResilientLLM(
+        providers,
+        retry_policy=RetryPolicy(
+            max_attempts=retry_config.get('max_attempts', 3),
+            base_delay=retry_config.get('base_delay_seconds', 0.5),
+            max_delay=retry_config.get('max_delay_seconds', 8.0)),
+        breakers={p.name: CircuitBreaker(
+            failure_threshold=breaker_config.get('failure_threshold', 5),
+            reset_seconds=breaker_config.get('reset_seconds', 30.0))
+            for p in providers},
+        deadline_seconds=resilience_config.get('deadline_seconds')
+    )
+
+
+# Shared instances, so circuit state and in-flight requests are shared
+# by all sessions
+_resilient_llm = None
+_llm = None
+_llm_lock = threading.Lock()
+
+
+def get_llm():
+    """
+    Get the process-wide LLM: the resilient LLM, wrapped in single-flight
+    coalescing unless models.single_flight is false
+    """
+    global _resilient_llm, _llm
+
+    with _llm_lock:
+        if _llm is None:
+            config = get_config()
+            _resilient_llm = create_resilient_llm(config)
+            _llm = _resilient_llm
+            if config['models'].get('single_flight', True):
+                # Identical prompts only coalesce when the model settings match
+                params = [(p.name, p.model_id, p.temperature, p.max_tokens)
+                          for p in _resilient_llm.providers]
+                _llm = SingleFlightLLM(_resilient_llm, params)
+    return _llm
+
+
+def get_llm_stats():
+    """Circuit breaker state per provider and single-flight counters"""
+    llm = get_llm()
+    return {
+        'providers': _resilient_llm.stats(),
+        'single_flight': llm.stats() if isinstance(llm, SingleFlightLLM) else None
+    }
+
+
+def _event_recorder():
+    """Record provider/retry/failover/coalesced events in the caller's trace"""
+    trace = current_trace()
+    if trace is None:
+        return None
+
+    def on_event(name, value):
+        if name == 'provider':
+            trace.record('llm_provider', value)
+        elif name == 'coalesced':
+            trace.record('llm_coalesced', True)
+        else:
+            trace.increment(f'llm_{name}s')
+    return on_event
+
+
+def generate_response(prompt, stream=False):
+    """
+    Generate a response with retries and failover; identical concurrent
+    prompts share one upstream call
+    Raises ProviderError (usually AllProvidersFailed) if no provider answers;
+    for streams the error is raised while iterating
+    """
+    llm = get_llm()
+    if stream:
+        return run_stream(prompt, llm, on_event=_event_recorder())
+    return run_generate(prompt, llm, on_event=_event_recorder())
@@ -0,0 +1,199 @@
+"""
+Semantic response cache in front of the LLM
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from src.utils.config import get_config
+
+
+# Knowledge base tables that matches come from, and their match types
+MATCH_SOURCES = {'faqs': 'faq', 'complaints': 'complaint'}
+
+
+def match_key(match):
+    """Identify a knowledge base match, e.g. "faq:3" """
+    return f"{match['type']}:{match['id']}"
+
+
+def match_fingerprint(match):
+    """Hash a match's row content so edits to the row invalidate entries"""
+    data = json.dumps(match.get('data'), sort_keys=True, default=str)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    Caches final responses keyed by the query embedding plus the set of
+    retrieved knowledge base matches. A lookup hits when the matches are
+    the same (and unchanged) and the query embedding is within the
+    similarity threshold of a cached one.
+    """
+
+    def __init__(self, similarity_threshold=0.95, ttl_seconds=3600, max_entries=512):
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self._entries = OrderedDict()
+        self._buckets = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+        # Row fingerprints of the last knowledge base snapshot seen
+        self.kb_version = None
+        self._kb_fingerprints = {}
+        self._kb_lock = threading.Lock()
+
+    @staticmethod
+    def _bucket_key(matches):
+        return tuple(sorted(match_key(m) for m in matches))
+
+    @staticmethod
+    def _normalize(embedding):
+        embedding = np.asarray(embedding, dtype=np.float32)
+        return embedding / max(float(np.linalg.norm(embedding)), 1e-12)
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        bucket = self._buckets.get(entry['bucket'])
+        if bucket is not None:
+            bucket.discard(entry_id)
+            if not bucket:
+                del self._buckets[entry['bucket']]
+
+    def lookup(self, query_embedding, matches):
+        """Get a cached response for a near-duplicate question, or None"""
+        bucket_key = self._bucket_key(matches)
+        fingerprints = {match_key(m): match_fingerprint(m) for m in matches}
+        query = self._normalize(query_embedding)
+        now = time.time()
+
+        with self._lock:
+            best_id, best_score = None, self.similarity_threshold
+            for entry_id in list(self._buckets.get(bucket_key, ())):
+                entry = self._entries[entry_id]
+
+                # Drop entries that expired or whose rows were edited
+                if now - entry['created_at'] > self.ttl_seconds or \
+                        entry['fingerprints'] != fingerprints:
+                    self._remove(entry_id)
+                    continue
+
+                score = float(entry['embedding'] @ query)
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+
+            if best_id is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id]['response']
+
+    def store(self, query_embedding, matches, response):
+        """Cache a response for a query and its matches"""
+        bucket_key = self._bucket_key(matches)
+
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+
+            self._entries[entry_id] = {
+                'bucket': bucket_key,
+                'embedding': self._normalize(query_embedding),
+                'fingerprints': {match_key(m): match_fingerprint(m) for m in matches},
+                'response': response,
+                'created_at': time.time()
+            }
+            self._buckets.setdefault(bucket_key, set()).add(entry_id)
+
+            # Size-based eviction, least recently used first
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, keys):
+        """Drop entries that used any of the given knowledge base keys"""
+        keys = set(keys)
+        with self._lock:
+            for entry_id in [entry_id for entry_id, entry in self._entries.items()
+                             if keys.intersection(entry['bucket'])]:
+                self._remove(entry_id)
+
+    def sync_knowledge_base(self, knowledge_base):
+        """
+        Drop entries that used rows edited or deleted since the previous
+        knowledge base snapshot, once per snapshot version. Lookups would
+        skip them anyway, but only once the same matches come up again.
+        """
+        version = knowledge_base.get('version')
+        if version is not None and version == self.kb_version:
+            return
+
+        fingerprints = {
+            match_key({'type': match_type, 'id': row['id']}):
+                match_fingerprint({'data': row})
+            for table, match_type in MATCH_SOURCES.items()
+            for row in knowledge_base.get(table, [])
+        }
+        with self._kb_lock:
+            previous = self._kb_fingerprints
+            self._kb_fingerprints = fingerprints
+            self.kb_version = version
+
+        changed = [key for key, fingerprint in previous.items()
+                   if fingerprints.get(key) != fingerprint]
+        if changed:
+            self.invalidate(changed)
+
+    def clear(self):
+        """Drop all entries"""
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self):
+        """Get size and hit/miss counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+
+# Shared cache, created on first use
+_response_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Get the process-wide response cache, or None if disabled in config"""
+    global _response_cache
+
+    cache_config = get_config().get('response_cache') or {}
+    if not cache_config.get('enabled', True):
+        return None
+
+    with _cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache(
+                similarity_threshold=cache_config.get('similarity_threshold', 0.95),
+                ttl_seconds=cache_config.get('ttl_seconds', 3600),
+                max_entries=cache_config.get('max_entries', 512)
+            )
+
+    return _response_cache
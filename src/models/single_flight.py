@@ -0,0 +1,146 @@
+"""
+Single-flight coalescing of identical in-flight LLM requests
+
+When several sessions send the same prompt with the same model parameters
+at the same time, only the first one calls the provider. The others wait
+on that call and get the same result; streaming callers receive the
+chunks as they arrive, including the ones sent before they joined.
+"""
+
+import asyncio
+import hashlib
+import json
+
+
+def prompt_key(prompt, params=None, options=None):
+    """Hash of the prompt, model parameters and per-request options"""
+    payload = json.dumps([prompt, params, options or {}],
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class Flight:
+    """One upstream call and everything it has produced so far"""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.task = None
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        # Wake current waiters; later waiters wait on a fresh event
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def add(self, chunk):
+        self.chunks.append(chunk)
+        self._notify()
+
+    def finish(self, error=None):
+        self.done = True
+        self.error = error
+        self._notify()
+
+    async def follow(self):
+        """Yield every chunk, from the first, until the call finishes"""
+        position = 0
+        while True:
+            while position < len(self.chunks):
+                yield self.chunks[position]
+                position += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+
+class SingleFlightLLM:
+    """
+    Provider-like wrapper (generate/stream) that coalesces identical
+    concurrent requests. All methods run on one event loop, so no locks
+    are needed. The upstream call runs as its own task and is cancelled
+    only when every caller waiting on it has gone away.
+    on_event('coalesced', key) is called for requests that joined a flight.
+    """
+
+    def __init__(self, llm, params=None):
+        self.llm = llm
+        self.params = params
+        self._flights = {}
+        self.requests = 0
+        self.deduplicated = 0
+
+    def _join(self, prompt, stream, timeout, on_usage, on_event, options):
+        key = prompt_key(prompt, self.params, options)
+        self.requests += 1
+
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.deduplicated += 1
+            if on_event:
+                on_event('coalesced', key)
+        else:
+            flight = Flight()
+            self._flights[key] = flight
+            flight.task = asyncio.get_running_loop().create_task(self._run(
+                key, flight, prompt, stream, timeout, on_usage, on_event, options))
+
+        flight.subscribers += 1
+        return flight
+
+    def _leave(self, flight):
+        flight.subscribers -= 1
+        if flight.subscribers == 0 and not flight.done:
+            flight.task.cancel()
+
+    async def _run(self, key, flight, prompt, stream, timeout, on_usage,
+                   on_event, options):
+        try:
+            if stream:
+                async for chunk in self.llm.stream(
+                        prompt, timeout=timeout, on_usage=on_usage,
+                        on_event=on_event, **options):
+                    flight.add(chunk)
+            else:
+                flight.add(await self.llm.generate(
+                    prompt, timeout=timeout, on_usage=on_usage,
+                    on_event=on_event, **options))
+            flight.finish()
+        except asyncio.CancelledError:
+            flight.finish(asyncio.CancelledError())
+            raise
+        except Exception as e:
+            flight.finish(e)
+        finally:
+            # New requests after this point start a fresh call
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    async def generate(self, prompt, timeout=None, on_usage=None,
+                       on_event=None, **options):
+        flight = self._join(prompt, False, timeout, on_usage, on_event, options)
+        try:
+            return "".join([chunk async for chunk in flight.follow()])
+        finally:
+            self._leave(flight)
+
+    async def stream(self, prompt, timeout=None, on_usage=None,
+                     on_event=None, **options):
+        flight = self._join(prompt, True, timeout, on_usage, on_event, options)
+        try:
+            async for chunk in flight.follow():
+                yield chunk
+        finally:
+            self._leave(flight)
+
+    def stats(self):
+        """Requests seen, requests served by another request's call, and calls in flight"""
+        return {
+            'requests': self.requests,
+            'deduplicated': self.deduplicated,
+            'in_flight': len(self._flights)
+        }
@@ -0,0 +1,214 @@
+"""
+LRU cache for query embeddings with an optional on-disk tier
+"""
+
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from src.database.connection import connect
+from src.utils.config import get_config
+from src.utils.tracing import increment
+
+
+def normalize_query(text):
+    """Normalise query text for cache lookups (case and whitespace)"""
+    return " ".join(text.split()).casefold()
+
+
+class EmbeddingCache:
+    """
+    Thread-safe LRU cache of query embeddings keyed on (model name,
+    normalised query text). When persist_path is set, entries are also
+    written to a small SQLite file so they survive restarts, in one
+    transaction per write_batch_size new entries or write_interval seconds
+    (and on flush()).
+    """
+
+    def __init__(self, max_size=1024, persist_path=None, write_batch_size=32,
+                 write_interval=5.0):
+        self.max_size = max_size
+        self.persist_path = persist_path
+        self.write_batch_size = write_batch_size
+        self.write_interval = write_interval
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+
+        # Entries not yet written to disk, and when they last were
+        self._pending = {}
+        self._last_write = time.monotonic()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if persist_path:
+            self._open_disk()
+
+    def _open_disk(self):
+        """Open (and create if needed) the on-disk tier"""
+        try:
+            os.makedirs(os.path.dirname(self.persist_path) or ".", exist_ok=True)
+            self._disk = connect(self.persist_path, check_same_thread=False)
+            self._disk.execute('''
+            CREATE TABLE IF NOT EXISTS query_embeddings (
+                model_name TEXT,
+                query TEXT,
+                dtype TEXT,
+                vector BLOB,
+                PRIMARY KEY (model_name, query)
+            )
+            ''')
+            self._disk.commit()
+        except sqlite3.Error as e:
+            print(f"Warning: Couldn't open query embedding cache. Error: {e}")
+            self._disk = None
+
+    def _read_disk(self, key):
+        if self._disk is None:
+            return None
+        if key in self._pending:
+            return self._pending[key]
+        row = self._disk.execute(
+            'SELECT dtype, vector FROM query_embeddings WHERE model_name = ? AND query = ?',
+            key
+        ).fetchone()
+        if row is None:
+            return None
+        return np.frombuffer(row[1], dtype=row[0])
+
+    def _write_disk(self, key, vector):
+        if self._disk is None:
+            return
+        self._pending[key] = vector
+        if (len(self._pending) >= self.write_batch_size
+                or time.monotonic() - self._last_write >= self.write_interval):
+            self._flush_disk()
+
+    def _flush_disk(self):
+        """Write the pending entries in one transaction (lock held)"""
+        self._last_write = time.monotonic()
+        if self._disk is None or not self._pending:
+            return
+        rows = [key + (vector.dtype.str, vector.tobytes())
+                for key, vector in self._pending.items()]
+        self._pending.clear()
+        try:
+            with self._disk:
+                self._disk.executemany(
+                    'INSERT OR REPLACE INTO query_embeddings (model_name, query, dtype, vector) VALUES (?, ?, ?, ?)',
+                    rows
+                )
+        except sqlite3.Error as e:
+            print(f"Warning: Couldn't save {len(rows)} query embeddings. Error: {e}")
+
+    def _store(self, key, vector):
+        """Insert into the in-memory tier, evicting the least recently used"""
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def get(self, model_name, text):
+        """Get a cached embedding, or None"""
+        key = (model_name, normalize_query(text))
+
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                increment('embedding_cache_hits')
+                return vector
+
+            vector = self._read_disk(key)
+            if vector is not None:
+                self._store(key, vector)
+                self.hits += 1
+                self.disk_hits += 1
+                increment('embedding_cache_hits')
+                return vector
+
+            self.misses += 1
+            increment('embedding_cache_misses')
+            return None
+
+    def put(self, model_name, text, vector):
+        """Add an embedding to the cache"""
+        key = (model_name, normalize_query(text))
+        vector = np.array(vector, copy=True)
+        vector.flags.writeable = False
+
+        with self._lock:
+            self._store(key, vector)
+            self._write_disk(key, vector)
+
+        return vector
+
+    def get_or_encode(self, model, model_name, text):
+        """Get the embedding for a query, encoding it on a cache miss"""
+        vector = self.get(model_name, text)
+        if vector is None:
+            vector = self.put(model_name, text, model.encode(text))
+        return vector
+
+    def flush(self):
+        """Write entries still waiting for the on-disk tier"""
+        with self._lock:
+            self._flush_disk()
+
+    def clear(self):
+        """Drop all in-memory entries and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.disk_hits = self.misses = 0
+
+    def stats(self):
+        """Get size and hit/miss counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+
+# Shared cache, created on first use
+_embedding_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    """Get the process-wide query embedding cache (nlp.query_cache config)"""
+    global _embedding_cache
+
+    with _cache_lock:
+        if _embedding_cache is None:
+            config = get_config()
+            cache_config = config['nlp'].get('query_cache') or {}
+            persist_path = None
+            if cache_config.get('persist', False):
+                base, _ = os.path.splitext(config['database']['path'])
+                persist_path = f"{base}.query_cache.db"
+            _embedding_cache = EmbeddingCache(
+                max_size=cache_config.get('max_size', 1024),
+                persist_path=persist_path,
+                write_batch_size=cache_config.get('write_batch_size', 32),
+                write_interval=cache_config.get('write_interval_seconds', 5.0)
+            )
+            atexit.register(_embedding_cache.flush)
+
+    return _embedding_cache
+
+
+def encode_query(model, model_name, text):
+    """Encode a query string through the shared embedding cache"""
+    return get_embedding_cache().get_or_encode(model, model_name, text)
@@ -0,0 +1,150 @@
+"""
+Persistent embedding index for knowledge base retrieval
+"""
+
+import hashlib
+import os
+import numpy as np
+
+
+def get_index_path(db_path, name="kb"):
+    """Get the on-disk location of an index stored next to the database"""
+    base, _ = os.path.splitext(db_path)
+    return f"{base}.{name}.embeddings.npz"
+
+
+def compute_row_hash(text):
+    """Hash a single row's text to detect edits"""
+    return hashlib.sha1((text or "").encode("utf-8")).hexdigest()
+
+
+class EmbeddingIndex:
+    """
+    Embeddings for a keyed corpus (e.g. "faq:3", "complaint:7").
+    Each row carries a content hash so that only inserted or edited rows
+    are re-encoded, and deleted rows are dropped without touching the rest.
+    """
+
+    def __init__(self, model, model_name, path=None):
+        self.model = model
+        self.model_name = model_name
+        self.path = path
+        self.keys = []
+        self.row_hashes = []
+        self.embeddings = None
+        self.loaded = False
+
+        # Bumped whenever the embeddings change, so search indexes built
+        # on top of them know when to rebuild
+        self.version = 0
+
+        # Counters from the most recent sync, useful for monitoring
+        self.last_encoded = 0
+        self.last_removed = 0
+
+    def sync(self, keys, texts):
+        """
+        Bring the index in line with the given rows and return the
+        embedding matrix, aligned with keys.
+        """
+        if not self.loaded:
+            self.load()
+
+        keys = list(keys)
+        row_hashes = [compute_row_hash(text) for text in texts]
+
+        if keys == self.keys and row_hashes == self.row_hashes:
+            self.last_encoded = 0
+            self.last_removed = 0
+            return self.embeddings
+
+        old_positions = {key: i for i, key in enumerate(self.keys)}
+        changed = [
+            i for i, (key, row_hash) in enumerate(zip(keys, row_hashes))
+            if key not in old_positions
+            or self.row_hashes[old_positions[key]] != row_hash
+        ]
+
+        new_vectors = None
+        if changed:
+            new_vectors = np.asarray(
+                self.model.encode([texts[i] for i in changed]))
+
+        if keys == self.keys:
+            # Same rows in the same order: patch stale vectors in place
+            self.embeddings[changed] = new_vectors
+            self.last_removed = 0
+        else:
+            self.embeddings = self._merge(
+                keys, old_positions, changed, new_vectors)
+            self.last_removed = len(set(self.keys) - set(keys))
+
+        self.keys = keys
+        self.row_hashes = row_hashes
+        self.last_encoded = len(changed)
+        self.version += 1
+        self.save()
+
+        return self.embeddings
+
+    def _merge(self, keys, old_positions, changed, new_vectors):
+        """Assemble a new matrix from reused and freshly encoded vectors"""
+        if new_vectors is not None:
+            dim = new_vectors.shape[1]
+            dtype = new_vectors.dtype
+        elif self.embeddings is not None and self.embeddings.size:
+            dim = self.embeddings.shape[1]
+            dtype = self.embeddings.dtype
+        else:
+            return np.zeros((len(keys), 0), dtype=np.float32)
+
+        merged = np.empty((len(keys), dim), dtype=dtype)
+        changed_set = set(changed)
+        for i, key in enumerate(keys):
+            if i not in changed_set:
+                merged[i] = self.embeddings[old_positions[key]]
+        if changed:
+            merged[changed] = new_vectors
+
+        return merged
+
+    def load(self):
+        """Load the index from disk if it was built with the same model"""
+        self.loaded = True
+
+        if not self.path or not os.path.exists(self.path):
+            return False
+
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                if str(data["model_name"]) != self.model_name:
+                    return False
+                self.keys = [str(key) for key in data["keys"]]
+                self.row_hashes = [str(h) for h in data["row_hashes"]]
+                self.embeddings = data["embeddings"]
+        except Exception as e:
+            print(f"Warning: Couldn't load embedding index, rebuilding. Error: {e}")
+            self.keys, self.row_hashes, self.embeddings = [], [], None
+            return False
+
+        return True
+
+    def save(self):
+        """Write the index to disk atomically"""
+        if not self.path:
+            return
+
+        tmp_path = self.path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f,
+                    embeddings=self.embeddings,
+                    keys=np.array(self.keys, dtype=str),
+                    row_hashes=np.array(self.row_hashes, dtype=str),
+                    model_name=np.array(self.model_name)
+                )
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Warning: Couldn't save embedding index. Error: {e}")
@@ -2,21 +2,16 @@
 Extract entities from user queries
 """
 
-import re
-import nltk
-from nltk import ne_chunk, pos_tag
-from nltk.tree import Tree
-from nltk.tokenize import word_tokenize
-
-# Download necessary NLTK data
-nltk.download('maxent_ne_chunker', quiet=True)
-nltk.download('words', quiet=True)
-nltk.download('averaged_perceptron_tagger', quiet=True)
+import threading
+from src.nlp.matcher import TermMatcher
+from src.nlp.nltk_resources import ensure_resources
+from src.utils.lazy import LazyProxy
+from src.utils.tracing import traced
 
 
 class EntityExtractor:
     def __init__(self, knowledge_base=None):
-        self.knowledge_base = knowledge_base
+        self._lock = threading.Lock()
 
         # Common industrial product terms
         self.product_terms = [
@@ -34,12 +29,74 @@ class EntityExtractor:
             "wear", "damage", "contamination"
         ]
 
+        self.knowledge_base = None
+        self.kb_version = None
+        self.product_names = []
+        self.matcher = None
+        self.refresh(knowledge_base)
+
+    def needs_refresh(self, knowledge_base):
+        """Check whether knowledge_base is a different snapshot than the one loaded"""
+        if not knowledge_base:
+            return False
+        version = knowledge_base.get('version')
+        return version is None or version != self.kb_version
+
+    def refresh(self, knowledge_base):
+        """Rebuild the product vocabulary, e.g. after the products table changed"""
         # If knowledge base is provided, extract product names
         if knowledge_base and 'products' in knowledge_base:
-            self.product_names = [p['name'].lower()
-                                  for p in knowledge_base['products']]
+            product_names = [p['name'].lower()
+                             for p in knowledge_base['products']]
         else:
-            self.product_names = []
+            product_names = []
+
+        matcher = self.build_matcher(product_names)
+
+        with self._lock:
+            self.knowledge_base = knowledge_base
+            self.kb_version = knowledge_base.get(
+                'version') if knowledge_base else None
+            self.product_names = product_names
+            self.matcher = matcher
+
+    def build_matcher(self, product_names):
+        """
+        Build one automaton over all vocabularies. Product names match as
+        substrings; part and issue terms need word boundaries.
+        """
+        matcher = TermMatcher()
+        for name in product_names:
+            matcher.add(name, 'products', whole_word=False)
+        for term in self.product_terms:
+            matcher.add(term, 'parts')
+        for issue in self.issue_types:
+            matcher.add(issue, 'issues')
+        return matcher.build()
+
+    def find_mentions(self, query, matcher=None):
+        """
+        Find product, part and issue mentions in a single pass over the query
+        matcher defaults to the current one; pass the one already in use so
+        a concurrent refresh() can't swap it out in between
+        Returns a list of dicts with the term, its type and offsets, in query order
+        """
+        matcher = matcher or self.matcher
+        query_lower = query.lower()
+
+        mentions = []
+        for start, end, term_id in matcher.find_all(query_lower):
+            term, category, _ = matcher.terms[term_id]
+            mentions.append({
+                'text': term,
+                'type': category,
+                'start': start,
+                'end': end,
+                'term_id': term_id
+            })
+        mentions.sort(key=lambda m: (m['start'], m['end']))
+
+        return mentions
 
     def extract_entities(self, query):
         """Extract entities from a query"""
@@ -50,7 +107,13 @@ class EntityExtractor:
             'locations': []
         }
 
+        from nltk import ne_chunk, pos_tag
+        from nltk.tree import Tree
+        from nltk.tokenize import word_tokenize
+
         # Tokenize and tag parts of speech
+        ensure_resources('punkt_tab', 'averaged_perceptron_tagger_eng',
+                         'maxent_ne_chunker_tab', 'words')
         tokens = word_tokenize(query)
         tagged = pos_tag(tokens)
 
@@ -67,33 +130,35 @@ class EntityExtractor:
                     entities['locations'].append(entity_name)
                 # Add other entity types as needed
 
-        # Extract product names and terms
-        for product_name in self.product_names:
-            if product_name.lower() in query.lower():
-                entities['products'].append(product_name)
+        # Extract product names, part terms and issue types in one pass, with
+        # the same matcher throughout as refresh() may replace it meanwhile
+        matcher = self.matcher
+        mentions = self.find_mentions(query, matcher)
 
-        for term in self.product_terms:
-            if re.search(r'\b' + term + r'\b', query.lower()):
-                entities['parts'].append(term)
+        # Report each term once, in vocabulary order
+        for term_id in sorted({m['term_id'] for m in mentions}):
+            term, category, _ = matcher.terms[term_id]
+            entities[category].append(term)
 
-        # Extract issue types
-        for issue in self.issue_types:
-            if re.search(r'\b' + issue + r'\b', query.lower()):
-                entities['issues'].append(issue)
+        entities['mentions'] = mentions
 
         return entities
 
 
-# Create a singleton instance
-entity_extractor = EntityExtractor()
+# Create a singleton instance, built on first use
+entity_extractor = LazyProxy(EntityExtractor)
+
 
+def refresh_entity_extractor(knowledge_base):
+    """Rebuild the shared extractor's vocabularies, e.g. when products change"""
+    entity_extractor.refresh(knowledge_base)
 
+
+@traced('entities')
 def extract_entities_from_query(query, knowledge_base=None):
     """Extract entities from a user query"""
-    global entity_extractor
-
-    # Update knowledge base if provided
-    if knowledge_base:
-        entity_extractor = EntityExtractor(knowledge_base)
+    # Rebuild the vocabularies only for a different knowledge base snapshot
+    if entity_extractor.needs_refresh(knowledge_base):
+        entity_extractor.refresh(knowledge_base)
 
     return entity_extractor.extract_entities(query)
@@ -0,0 +1,50 @@
+"""
+Lexical (BM25 full-text) retrieval and hybrid merging with semantic matches
+"""
+
+import sqlite3
+from src.database.query import search
+from src.utils.tracing import traced
+
+# Knowledge base tables the prompt templates know how to present
+RETRIEVAL_SOURCES = ('faqs', 'complaints')
+
+
+@traced('lexical_retrieval')
+def find_lexical_matches(query, top_k=3):
+    """
+    Find knowledge base entries sharing words with the query, in the same
+    format as semantic_search.find_best_match. 'similarity' is the BM25
+    score squashed into [0, 1).
+    """
+    try:
+        results = search(query, sources=RETRIEVAL_SOURCES, limit=top_k)
+    except sqlite3.Error as e:
+        # e.g. a database that hasn't been migrated yet
+        print(f"Warning: Full-text search failed. Error: {e}")
+        return []
+
+    return [{
+        "type": result["type"],
+        "id": result["id"],
+        "data": result["data"],
+        "similarity": result["score"] / (1 + result["score"])
+    } for result in results if result["score"] > 0]
+
+
+def merge_matches(semantic, lexical, top_k=3, k=60):
+    """
+    Combine semantic and lexical matches with reciprocal rank fusion:
+    each match scores 1 / (k + rank) per list it appears in. Matches found
+    by both keep the semantic entry, and semantic matches win ties.
+    """
+    fused = {}
+    entries = {}
+    for matches in (semantic, lexical):
+        for rank, match in enumerate(matches, start=1):
+            key = (match["type"], match["id"])
+            fused[key] = fused.get(key, 0) + 1 / (k + rank)
+            entries.setdefault(key, match)
+
+    ranked = sorted(fused, key=fused.get, reverse=True)
+    return [entries[key] for key in ranked[:top_k]]
@@ -0,0 +1,103 @@
+"""
+Multi-pattern term matching with an Aho-Corasick automaton
+"""
+
+from collections import deque
+
+
+def _is_word_char(ch):
+    """Same notion of a word character as the regex \\w class"""
+    return ch.isalnum() or ch == '_'
+
+
+class TermMatcher:
+    """
+    Finds every occurrence of a set of terms in one linear pass over the
+    text. Terms can require word boundaries (like \\bterm\\b in a regex)
+    and carry a category, e.g. 'product', 'part' or 'issue'.
+    Matching is case-sensitive; lowercase both terms and text if needed.
+    """
+
+    def __init__(self):
+        self.terms = []
+        self._goto = None
+        self._fail = None
+        self._output = None
+
+    def add(self, term, category=None, whole_word=True):
+        """Add a term; returns its id. Call build() after adding terms."""
+        self.terms.append((term, category, whole_word))
+        self._goto = None
+        return len(self.terms) - 1
+
+    def build(self):
+        """Build the trie and failure links"""
+        goto = [{}]
+        output = [[]]
+
+        for term_id, (term, _, _) in enumerate(self.terms):
+            if not term:
+                continue
+            node = 0
+            for ch in term:
+                next_node = goto[node].get(ch)
+                if next_node is None:
+                    goto.append({})
+                    output.append([])
+                    next_node = len(goto) - 1
+                    goto[node][ch] = next_node
+                node = next_node
+            output[node].append(term_id)
+
+        # Breadth-first pass to compute failure links
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in goto[node].items():
+                queue.append(child)
+                state = fail[node]
+                while state and ch not in goto[state]:
+                    state = fail[state]
+                fallback = goto[state].get(ch, 0)
+                fail[child] = fallback if fallback != child else 0
+                output[child] = output[child] + output[fail[child]]
+
+        self._goto, self._fail, self._output = goto, fail, output
+        return self
+
+    def _has_boundaries(self, text, start, end):
+        """Check for \\b at both ends of text[start:end]"""
+        before = start > 0 and _is_word_char(text[start - 1])
+        after = end < len(text) and _is_word_char(text[end])
+        return (before != _is_word_char(text[start]) and
+                after != _is_word_char(text[end - 1]))
+
+    def find_all(self, text):
+        """
+        Find all term occurrences, including overlapping ones
+        Returns a list of (start, end, term_id) ordered by end offset
+        """
+        if self._goto is None:
+            self.build()
+        goto, fail, output = self._goto, self._fail, self._output
+
+        matches = []
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+
+            for term_id in output[node]:
+                term, _, whole_word = self.terms[term_id]
+                start, end = i + 1 - len(term), i + 1
+                if whole_word and not self._has_boundaries(text, start, end):
+                    continue
+                matches.append((start, end, term_id))
+
+        return matches
+
+    def find_terms(self, text):
+        """Get the set of term ids that occur in text"""
+        return {term_id for _, _, term_id in self.find_all(text)}
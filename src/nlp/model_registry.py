@@ -0,0 +1,84 @@
+"""
+Process-wide registry of sentence transformer models
+"""
+
+import threading
+import time
+from src.utils.config import get_config
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Loaded models and their load statistics, keyed by (model name, device)
+_models = {}
+_model_stats = {}
+_lock = threading.Lock()
+
+
+def get_model_name():
+    """Get the configured sentence transformer model name"""
+    return get_config()['nlp'].get('sentence_transformer', 'all-MiniLM-L6-v2')
+
+
+def get_model_device():
+    """Get the configured device for embedding models (None lets torch decide)"""
+    return get_config()['nlp'].get('device')
+
+
+def _peak_rss_mb():
+    """Peak resident set size of the process in MB, if available"""
+    if resource is None:
+        return None
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def get_sentence_model(model_name=None, device=None):
+    """
+    Get a shared SentenceTransformer instance, loading it on first use.
+    Defaults to the model and device from the nlp config section.
+    """
+    if model_name is None:
+        model_name = get_model_name()
+    if device is None:
+        device = get_model_device()
+    key = (model_name, device)
+
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    with _lock:
+        # Another thread may have loaded it while we waited
+        if key in _models:
+            return _models[key]
+
+        from sentence_transformers import SentenceTransformer
+
+        rss_before = _peak_rss_mb()
+        start = time.perf_counter()
+        model = SentenceTransformer(model_name, device=device)
+        load_seconds = time.perf_counter() - start
+        rss_after = _peak_rss_mb()
+
+        parameter_bytes = sum(p.numel() * p.element_size()
+                              for p in model.parameters())
+
+        _models[key] = model
+        _model_stats[key] = {
+            'model_name': model_name,
+            'device': str(model.device),
+            'load_seconds': load_seconds,
+            'parameter_mb': parameter_bytes / (1024 * 1024),
+            'rss_increase_mb': (rss_after - rss_before
+                                if rss_before is not None else None)
+        }
+
+    return model
+
+
+def get_model_stats():
+    """Get load time and memory statistics for every loaded model"""
+    return list(_model_stats.values())
@@ -0,0 +1,109 @@
+"""
+Lazy, offline-safe loading of NLTK resources
+
+Resources are looked up on first use in the configured data directory
+(nlp.nltk_data, or the NLTK_DATA environment variable) and only downloaded
+if they are missing and nlp.nltk_auto_download allows it. To vendor them
+for servers without network access, run:
+
+    python -m src.nlp.nltk_resources --dir data/nltk_data
+"""
+
+import argparse
+import os
+import threading
+from src.utils.config import get_config
+
+# NLTK resource names and the paths nltk.data.find() looks them up by.
+# NLTK 3.9+ loads the tokenizer, tagger and chunker from the *_tab/_eng
+# formats rather than the old pickles (see requirements.txt)
+RESOURCES = {
+    'punkt_tab': 'tokenizers/punkt_tab',
+    'stopwords': 'corpora/stopwords',
+    'wordnet': 'corpora/wordnet',
+    'maxent_ne_chunker_tab': 'chunkers/maxent_ne_chunker_tab',
+    'words': 'corpora/words',
+    'averaged_perceptron_tagger_eng': 'taggers/averaged_perceptron_tagger_eng'
+}
+
+_ready = set()
+_data_path_configured = False
+_lock = threading.Lock()
+
+
+def get_data_dir():
+    """Get the local NLTK data directory, if one is configured"""
+    nlp_config = get_config().get('nlp') or {}
+    return nlp_config.get('nltk_data') or os.environ.get('NLTK_DATA')
+
+
+def _configure_data_path(nltk):
+    """Make NLTK search the configured data directory first"""
+    global _data_path_configured
+
+    if _data_path_configured:
+        return
+    data_dir = get_data_dir()
+    if data_dir and data_dir not in nltk.data.path:
+        nltk.data.path.insert(0, data_dir)
+    _data_path_configured = True
+
+
+def ensure_resources(*names):
+    """
+    Make sure NLTK resources are available before they are used.
+    Raises LookupError if a resource is missing and downloads are disabled.
+    """
+    missing = [name for name in names if name not in _ready]
+    if not missing:
+        return
+
+    import nltk
+
+    with _lock:
+        _configure_data_path(nltk)
+        auto_download = (get_config().get('nlp') or {}).get(
+            'nltk_auto_download', True)
+
+        for name in missing:
+            if name in _ready:
+                continue
+            try:
+                nltk.data.find(RESOURCES.get(name, name))
+            except LookupError:
+                if not auto_download:
+                    raise LookupError(
+                        f"NLTK resource '{name}' not found. Provision it with: "
+                        f"python -m src.nlp.nltk_resources --dir <nltk_data dir>")
+                nltk.download(name, download_dir=get_data_dir(), quiet=True)
+                nltk.data.find(RESOURCES.get(name, name))
+            _ready.add(name)
+
+
+def provision(download_dir, names=None):
+    """Download resources into download_dir; returns the names that failed"""
+    import nltk
+
+    os.makedirs(download_dir, exist_ok=True)
+    failed = []
+    for name in names or RESOURCES:
+        if not nltk.download(name, download_dir=download_dir, quiet=True):
+            failed.append(name)
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Download the NLTK resources the chatbot uses into a local directory")
+    parser.add_argument("--dir", default=None,
+                        help="target directory (defaults to nlp.nltk_data)")
+    args = parser.parse_args()
+
+    target = args.dir or get_data_dir()
+    if not target:
+        parser.error("no --dir given and nlp.nltk_data is not configured")
+
+    failed = provision(target)
+    if failed:
+        raise SystemExit(f"Failed to download: {', '.join(failed)}")
+    print(f"NLTK resources saved to {target}")
@@ -1,18 +1,31 @@
-import nltk
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
-
-# Download necessary NLTK data
-nltk.download('punkt', quiet=True)
-nltk.download('stopwords', quiet=True)
-nltk.download('wordnet', quiet=True)
+from src.nlp.nltk_resources import ensure_resources
+from src.utils.lazy import LazyProxy
+from src.utils.tracing import traced
 
 
 class TextPreprocessor:
     def __init__(self):
-        self.lemmatizer = WordNetLemmatizer()
-        self.stop_words = set(stopwords.words('english'))
+        # NLTK data is loaded on first use, not at import time
+        self._lemmatizer = None
+        self._stop_words = None
+
+    @property
+    def lemmatizer(self):
+        if self._lemmatizer is None:
+            from nltk.stem import WordNetLemmatizer
+
+            ensure_resources('wordnet')
+            self._lemmatizer = WordNetLemmatizer()
+        return self._lemmatizer
+
+    @property
+    def stop_words(self):
+        if self._stop_words is None:
+            from nltk.corpus import stopwords
+
+            ensure_resources('stopwords')
+            self._stop_words = set(stopwords.words('english'))
+        return self._stop_words
 
     def preprocess(self, text):
         """
@@ -22,7 +35,10 @@ class TextPreprocessor:
         3. Remove stopwords and punctuation
         4. Lemmatize
         """
+        from nltk.tokenize import word_tokenize
+
         # Lowercase and tokenize
+        ensure_resources('punkt_tab')
         tokens = word_tokenize(text.lower())
 
         # Remove stopwords and punctuation
@@ -34,10 +50,11 @@ class TextPreprocessor:
         return tokens
 
 
-# Create a singleton instance
-preprocessor = TextPreprocessor()
+# Create a singleton instance, built on first use
+preprocessor = LazyProxy(TextPreprocessor)
 
 
+@traced('preprocess')
 def preprocess_query(query):
     """Preprocess a user query"""
     return preprocessor.preprocess(query)
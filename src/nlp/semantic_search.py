@@ -1,59 +1,165 @@
-from sentence_transformers import SentenceTransformer
-import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+import threading
+from src.nlp.embedding_cache import encode_query
+from src.nlp.embedding_index import EmbeddingIndex, get_index_path
+from src.nlp.model_registry import get_model_name, get_sentence_model
+from src.nlp.vector_index import create_index
+from src.utils.config import get_config
+from src.utils.lazy import LazyProxy
+from src.utils.tracing import traced
 
 
 class SemanticSearch:
     def __init__(self):
-        # Load a pre-trained sentence transformer model
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
+        # Use the configured sentence transformer, shared across the process
+        self.model_name = get_model_name()
+        self.model = get_sentence_model(self.model_name)
+
+        # Vector index over the corpus, rebuilt when the corpus changes
+        self.index = None
+        self.index_version = None
+        self._index_lock = threading.Lock()
 
     def encode(self, texts):
         """Encode texts into embeddings"""
         return self.model.encode(texts)
 
-    def search(self, query_embedding, corpus_embeddings, top_k=3):
-        """Search for the most similar texts"""
-        # Calculate cosine similarity
-        similarities = cosine_similarity(
-            [query_embedding], corpus_embeddings)[0]
+    def build_index(self, corpus_embeddings, version=None):
+        """Build the configured vector index (nlp.index) over the corpus"""
+        index_config = dict(get_config()['nlp'].get('index') or {})
+        index_type = index_config.pop('type', 'brute_force')
 
-        # Get indices of top-k most similar items
-        top_indices = np.argsort(similarities)[::-1][:top_k]
+        self.index = create_index(index_type, **index_config)
+        self.index.build(corpus_embeddings)
+        self.index_version = version
 
-        return [(idx, similarities[idx]) for idx in top_indices]
+    def search(self, query_embedding, corpus_embeddings, top_k=3, version=None):
+        """
+        Search for the most similar texts
+        Pass the corpus version to reuse the index between queries;
+        without one the index is rebuilt for this corpus.
+        """
+        return self._get_index(corpus_embeddings, version).search(
+            query_embedding, top_k)
 
+    def search_batch(self, query_embeddings, corpus_embeddings, top_k=3, version=None):
+        """Search for several queries at once; one result list per query"""
+        return self._get_index(corpus_embeddings, version).search_batch(
+            query_embeddings, top_k)
 
-# Create a singleton instance
-semantic_search = SemanticSearch()
+    def _get_index(self, corpus_embeddings, version):
+        """Get the index for this corpus version, rebuilding it if needed"""
+        with self._index_lock:
+            if self.index is None or version is None or version != self.index_version:
+                self.build_index(corpus_embeddings, version)
+            return self.index
 
 
-def find_best_match(query, knowledge_base, top_k=3):
-    """Find the best matching entries from the knowledge base"""
-    # Prepare knowledge base items
+# Create a singleton instance, the model is loaded on first use
+semantic_search = LazyProxy(SemanticSearch)
+
+# Knowledge base embedding index, created on first use
+_kb_index = None
+
+# Snapshot version, items, embeddings and embedding index version for the
+# last knowledge base snapshot seen; read and replaced as one tuple so they
+# always belong together
+_kb_corpus = (None, None, None, None)
+_kb_corpus_lock = threading.Lock()
+
+
+def get_kb_index():
+    """Get the persistent embedding index for the knowledge base"""
+    global _kb_index
+
+    if _kb_index is None:
+        db_path = get_config()['database']['path']
+        _kb_index = EmbeddingIndex(
+            semantic_search.model,
+            semantic_search.model_name,
+            path=get_index_path(db_path)
+        )
+
+    return _kb_index
+
+
+def prepare_knowledge_base_items(knowledge_base):
+    """Build the searchable items, their index keys and texts from the knowledge base"""
     items = []
+    item_keys = []
     item_texts = []
 
     # Prepare FAQs
-    for idx, faq in enumerate(knowledge_base["faqs"]):
+    for faq in knowledge_base["faqs"]:
         items.append({"type": "faq", "id": faq["id"], "data": faq})
+        item_keys.append(f"faq:{faq['id']}")
         item_texts.append(faq["question"])
 
     # Prepare Complaints
-    for idx, complaint in enumerate(knowledge_base["complaints"]):
+    for complaint in knowledge_base["complaints"]:
         items.append(
             {"type": "complaint", "id": complaint["id"], "data": complaint})
+        item_keys.append(f"complaint:{complaint['id']}")
         item_texts.append(complaint["description"])
 
-    # Encode query
+    return items, item_keys, item_texts
+
+
+def get_knowledge_base_corpus(knowledge_base):
+    """
+    Get the searchable items, their embeddings and the embedding index
+    version they came from, for a knowledge base.
+    Snapshots carrying a 'version' are only prepared and synced with the
+    index once per version.
+    """
+    global _kb_corpus
+
+    version = knowledge_base.get("version")
+    cached_version, items, embeddings, index_version = _kb_corpus
+    if version is not None and version == cached_version:
+        return items, embeddings, index_version
+
+    with _kb_corpus_lock:
+        # Another session may have synced this version while we waited
+        cached_version, items, embeddings, index_version = _kb_corpus
+        if version is not None and version == cached_version:
+            return items, embeddings, index_version
+
+        items, item_keys, item_texts = prepare_knowledge_base_items(knowledge_base)
+        kb_index = get_kb_index()
+        embeddings = kb_index.sync(item_keys, item_texts) if items else None
+        index_version = kb_index.version
+        _kb_corpus = (version, items, embeddings, index_version)
+
+    return items, embeddings, index_version
+
+
+def build_knowledge_base_index(knowledge_base):
+    """Load or build the knowledge base index, e.g. at application startup"""
+    _, embeddings, _ = get_knowledge_base_corpus(knowledge_base)
+    return embeddings
+
+
+def get_query_embedding(query):
+    """Get the (cached) embedding used to search for a query"""
     query_text = " ".join(query) if isinstance(query, list) else query
-    query_embedding = semantic_search.model.encode(query_text)
+    return encode_query(
+        semantic_search.model, semantic_search.model_name, query_text)
+
+
+@traced('retrieval')
+def find_best_match(query, knowledge_base, top_k=3):
+    """Find the best matching entries from the knowledge base"""
+    # Get knowledge base items and embeddings, re-encoding only rows that changed
+    items, corpus_embeddings, index_version = get_knowledge_base_corpus(knowledge_base)
+    if not items:
+        return []
 
-    # Encode all items
-    corpus_embeddings = semantic_search.model.encode(item_texts)
+    # Encode query, reusing the embedding of a recently seen identical query
+    query_embedding = get_query_embedding(query)
 
     # Search for most similar items
-    results = semantic_search.search(query_embedding, corpus_embeddings, top_k)
+    results = semantic_search.search(
+        query_embedding, corpus_embeddings, top_k, version=index_version)
 
     # Format results
     matches = []
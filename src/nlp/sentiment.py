@@ -2,8 +2,9 @@
 Sentiment analysis for user queries
 """
 
-import re
-from textblob import TextBlob
+from src.nlp.matcher import TermMatcher
+from src.utils.lazy import LazyProxy
+from src.utils.tracing import traced
 
 
 class SentimentAnalyzer:
@@ -30,6 +31,28 @@ class SentimentAnalyzer:
             "right away", "now", "life-threatening", "catastrophic"
         ]
 
+        # Compile all lexicons into one matcher
+        self.matcher = TermMatcher()
+        for term in self.positive_terms:
+            self.matcher.add(term, 'positive')
+        for term in self.negative_terms:
+            self.matcher.add(term, 'negative')
+        for term in self.urgent_terms:
+            self.matcher.add(term, 'urgent')
+        self.matcher.build()
+
+        # TextBlob's default analyzer, used directly to skip building a blob
+        from textblob.en.sentiments import PatternAnalyzer
+
+        self.polarity_analyzer = PatternAnalyzer()
+
+    def count_terms(self, text):
+        """Count the distinct positive, negative and urgent terms in text"""
+        counts = {'positive': 0, 'negative': 0, 'urgent': 0}
+        for term_id in self.matcher.find_terms(text.lower()):
+            counts[self.matcher.terms[term_id][1]] += 1
+        return counts
+
     def analyze_sentiment(self, text):
         """
         Analyze sentiment of text
@@ -37,18 +60,13 @@ class SentimentAnalyzer:
             dict with sentiment scores and detected mood
         """
         # Use TextBlob for basic sentiment analysis
-        blob = TextBlob(text)
-        polarity = blob.sentiment.polarity
-        subjectivity = blob.sentiment.subjectivity
+        polarity, subjectivity = self.polarity_analyzer.analyze(text)
 
         # Count positive and negative terms
-        text_lower = text.lower()
-        positive_count = sum(1 for term in self.positive_terms if re.search(
-            r'\b' + re.escape(term) + r'\b', text_lower))
-        negative_count = sum(1 for term in self.negative_terms if re.search(
-            r'\b' + re.escape(term) + r'\b', text_lower))
-        urgent_count = sum(1 for term in self.urgent_terms if re.search(
-            r'\b' + re.escape(term) + r'\b', text_lower))
+        counts = self.count_terms(text)
+        positive_count = counts['positive']
+        negative_count = counts['negative']
+        urgent_count = counts['urgent']
 
         # Adjust polarity based on domain-specific terms
         domain_polarity = (positive_count - negative_count) / \
@@ -74,11 +92,21 @@ class SentimentAnalyzer:
             'mood': mood
         }
 
+    def analyze_batch(self, texts):
+        """Analyze sentiment of many texts, e.g. to re-score past interactions"""
+        return [self.analyze_sentiment(text) for text in texts]
 
-# Create a singleton instance
-sentiment_analyzer = SentimentAnalyzer()
 
+# Create a singleton instance, built on first use
+sentiment_analyzer = LazyProxy(SentimentAnalyzer)
 
+
+@traced('sentiment')
 def analyze_query_sentiment(query):
     """Analyze sentiment of a user query"""
     return sentiment_analyzer.analyze_sentiment(query)
+
+
+def analyze_sentiment_batch(texts):
+    """Analyze sentiment of many texts"""
+    return sentiment_analyzer.analyze_batch(texts)
@@ -0,0 +1,81 @@
+"""
+Vectorised top-k cosine similarity scoring shared by all retrievers
+"""
+
+import numpy as np
+
+
+def normalize(vectors):
+    """L2-normalise vectors (1-D or 2-D) as float32"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def select_top_k(scores, top_k):
+    """
+    Indices of the top_k scores along the last axis, best first.
+    Uses argpartition so only the k winners are sorted.
+    """
+    scores = np.asarray(scores)
+    n = scores.shape[-1]
+    top_k = min(top_k, n)
+    if top_k <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.int64)
+
+    if top_k < n:
+        candidates = np.argpartition(scores, n - top_k, axis=-1)[..., n - top_k:]
+    else:
+        candidates = np.broadcast_to(np.arange(n), scores.shape)
+    candidate_scores = np.take_along_axis(scores, candidates, axis=-1)
+    order = np.argsort(-candidate_scores, axis=-1, kind="stable")
+
+    return np.take_along_axis(candidates, order, axis=-1)
+
+
+class TopKScorer:
+    """
+    Holds an L2-normalised float32 corpus matrix so that cosine similarity
+    is a single matrix product per query, or per batch of queries.
+    """
+
+    def __init__(self, embeddings=None):
+        self.matrix = None
+        if embeddings is not None:
+            self.fit(embeddings)
+
+    def fit(self, embeddings):
+        """Normalise and store the corpus embeddings"""
+        embeddings = np.asarray(embeddings)
+        if embeddings.ndim != 2 or embeddings.size == 0:
+            self.matrix = None
+        else:
+            self.matrix = normalize(embeddings)
+        return self
+
+    def __len__(self):
+        return 0 if self.matrix is None else len(self.matrix)
+
+    def scores(self, query_embeddings):
+        """Cosine similarities of one query (1-D) or many (2-D) to the corpus"""
+        return normalize(query_embeddings) @ self.matrix.T
+
+    def search(self, query_embedding, top_k=3):
+        """Return a list of (corpus index, similarity), best first"""
+        if self.matrix is None:
+            return []
+
+        scores = self.scores(query_embedding)
+        return [(int(idx), float(scores[idx]))
+                for idx in select_top_k(scores, top_k)]
+
+    def search_batch(self, query_embeddings, top_k=3):
+        """Score many queries in one matrix product; one result list per query"""
+        query_embeddings = np.asarray(query_embeddings)
+        if self.matrix is None:
+            return [[] for _ in range(len(query_embeddings))]
+
+        scores = self.scores(query_embeddings)
+        top = select_top_k(scores, top_k)
+        return [[(int(idx), float(row_scores[idx])) for idx in row_top]
+                for row_scores, row_top in zip(scores, top)]
@@ -0,0 +1,210 @@
+"""
+Vector indexes for semantic search: exact brute force and an IVF
+approximate nearest-neighbour index that runs on CPU with NumPy only
+"""
+
+import argparse
+import time
+import numpy as np
+from src.nlp.topk import TopKScorer, normalize, select_top_k
+
+
+class VectorIndex:
+    """Interface for indexes used by SemanticSearch"""
+
+    def build(self, embeddings):
+        """Index the corpus embeddings"""
+        raise NotImplementedError
+
+    def search(self, query_embedding, top_k=3):
+        """Return a list of (corpus index, similarity), best first"""
+        raise NotImplementedError
+
+    def search_batch(self, query_embeddings, top_k=3):
+        """Search for several queries; one result list per query"""
+        return [self.search(query, top_k) for query in query_embeddings]
+
+    def __len__(self):
+        return 0
+
+
+class BruteForceIndex(VectorIndex):
+    """Exact search against every corpus vector"""
+
+    def __init__(self):
+        self.scorer = TopKScorer()
+
+    def build(self, embeddings):
+        self.scorer.fit(embeddings)
+        return self
+
+    def search(self, query_embedding, top_k=3):
+        return self.scorer.search(query_embedding, top_k)
+
+    def search_batch(self, query_embeddings, top_k=3):
+        return self.scorer.search_batch(query_embeddings, top_k)
+
+    def __len__(self):
+        return len(self.scorer)
+
+
+class IVFIndex(VectorIndex):
+    """
+    Inverted file index: vectors are clustered with spherical k-means and a
+    query only scans the nprobe clusters whose centroids are closest to it.
+    Raising nprobe trades latency for recall; nprobe == nlist is exact.
+    """
+
+    def __init__(self, nlist=1024, nprobe=16, train_iterations=10,
+                 train_size=65536, seed=0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_iterations = train_iterations
+        self.train_size = train_size
+        self.seed = seed
+
+        self.centroids = None
+        self.list_ids = None
+        self.list_offsets = None
+        self.list_vectors = None
+
+    def build(self, embeddings):
+        vectors = normalize(embeddings)
+        n = len(vectors)
+        if n == 0:
+            self.centroids = None
+            return self
+
+        nlist = max(1, min(self.nlist, n))
+        rng = np.random.default_rng(self.seed)
+
+        # Train centroids on a sample of the corpus
+        sample = vectors[rng.choice(n, min(n, self.train_size), replace=False)]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(self.train_iterations):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            counts = np.bincount(assignments, minlength=nlist)
+            # Empty clusters keep their previous centroid
+            filled = counts > 0
+            centroids[filled] = normalize(sums[filled])
+        self.centroids = centroids
+
+        # Assign every vector in chunks to bound memory use
+        assignments = np.empty(n, dtype=np.int64)
+        for start in range(0, n, 65536):
+            chunk = vectors[start:start + 65536]
+            assignments[start:start + 65536] = np.argmax(
+                chunk @ centroids.T, axis=1)
+
+        # Store each inverted list contiguously
+        order = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=nlist)
+        self.list_ids = order
+        self.list_offsets = np.concatenate(([0], np.cumsum(counts)))
+        self.list_vectors = vectors[order]
+
+        return self
+
+    def search(self, query_embedding, top_k=3, nprobe=None):
+        if self.centroids is None:
+            return []
+
+        query = normalize(query_embedding)
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+
+        # Pick the closest clusters to scan
+        probes = select_top_k(self.centroids @ query, nprobe)
+        ranges = [(self.list_offsets[c], self.list_offsets[c + 1])
+                  for c in probes]
+        positions = np.concatenate(
+            [np.arange(start, end) for start, end in ranges])
+        if len(positions) == 0:
+            return []
+
+        # Score only the candidates from the probed lists
+        scores = self.list_vectors[positions] @ query
+        best = select_top_k(scores, top_k)
+
+        return [(int(self.list_ids[positions[i]]), float(scores[i]))
+                for i in best]
+
+    def __len__(self):
+        return 0 if self.list_ids is None else len(self.list_ids)
+
+
+INDEX_TYPES = {
+    "brute_force": BruteForceIndex,
+    "ivf": IVFIndex
+}
+
+
+def create_index(index_type="brute_force", **params):
+    """Create an index by name, e.g. from the nlp.index config section"""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown vector index type: {index_type}")
+    return INDEX_TYPES[index_type](**params)
+
+
+def benchmark_recall(corpus, queries, top_k=10, nlist=1024,
+                     nprobe_values=(1, 2, 4, 8, 16, 32, 64)):
+    """
+    Measure IVF recall@top_k and latency against exact brute-force search
+    Returns a list of dicts, one per nprobe value
+    """
+    corpus = normalize(corpus)
+    queries = normalize(queries)
+
+    # Ground truth from exact search, all queries in one matrix product
+    start = time.perf_counter()
+    exact = [set(idx for idx, _ in found) for found in
+             BruteForceIndex().build(corpus).search_batch(queries, top_k)]
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    ivf = IVFIndex(nlist=nlist)
+    start = time.perf_counter()
+    ivf.build(corpus)
+    build_s = time.perf_counter() - start
+
+    results = []
+    for nprobe in nprobe_values:
+        hits = 0
+        start = time.perf_counter()
+        for q, truth in zip(queries, exact):
+            found = ivf.search(q, top_k, nprobe=nprobe)
+            hits += len(truth.intersection(idx for idx, _ in found))
+        latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        results.append({
+            "nprobe": nprobe,
+            "recall": hits / (top_k * len(queries)),
+            "latency_ms": latency_ms,
+            "brute_force_ms": exact_ms,
+            "build_s": build_s
+        })
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark IVF recall against brute-force search")
+    parser.add_argument("--size", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=1024)
+    args = parser.parse_args()
+
+    # Clustered synthetic data, closer to real embeddings than uniform noise
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(args.nlist, args.dim))
+    labels = rng.integers(0, args.nlist, args.size + args.queries)
+    data = centers[labels] + 0.5 * rng.normal(size=(len(labels), args.dim))
+    corpus, queries = data[:args.size], data[args.size:]
+
+    print(f"{'nprobe':>6} {'recall':>7} {'ivf ms':>8} {'exact ms':>9}")
+    for row in benchmark_recall(corpus, queries, args.top_k, args.nlist):
+        print(f"{row['nprobe']:>6} {row['recall']:>7.3f} "
+              f"{row['latency_ms']:>8.2f} {row['brute_force_ms']:>9.2f}")
@@ -1,28 +1,90 @@
-def create_enhanced_prompt(query, matches):
-    """Create an enhanced prompt using dynamic fine-control"""
-    # Base prompt
-    prompt = f"User query: {query}\n\n"
+from src.prompts.token_budget import count_tokens, get_prompt_budget, truncate_to_tokens
+from src.utils.tracing import record, traced
 
-    # Add context from knowledge base matches
+INSTRUCTIONS = (
+    "Instructions:\n"
+    "1. Provide a helpful, concise response addressing the user's query.\n"
+    "2. Include specific details from the knowledge base when relevant.\n"
+    "3. If the query mentions specific products, highlight solutions for those products.\n"
+    "4. Format your response in a conversational, supportive tone.\n"
+    "5. If multiple solutions exist, prioritize the most effective one first.\n"
+)
+
+CONTEXT_HEADER = "Relevant information from knowledge base:\n\n"
+
+# Don't add a truncated match with less room than this for its text
+MIN_TRUNCATED_TOKENS = 32
+
+
+def _format_match(number, match, body=None):
+    """Format one match; body replaces the answer/solution text if given"""
+    data = match['data']
+    if match["type"] == "faq":
+        return (f"FAQ {number} (Relevance: {match['similarity']:.2f}):\n"
+                f"Question: {data['question']}\n"
+                f"Answer: {data['answer'] if body is None else body}\n\n")
+    # complaint
+    return (f"Similar Issue {number} (Relevance: {match['similarity']:.2f}):\n"
+            f"Problem: {data['description']}\n"
+            f"Solution: {data['solution'] if body is None else body}\n\n")
+
+
+def _long_field(match):
+    return match['data']['answer' if match["type"] == "faq" else 'solution']
+
+
+@traced('prompt_build')
+def create_enhanced_prompt(query, matches, max_prompt_tokens=None):
+    """
+    Create an enhanced prompt using dynamic fine-control
+    matches must already be ranked, most relevant first (e.g. by
+    merge_matches). They are added in that order until the prompt token budget
+    (see token_budget.get_prompt_budget) is used up; the match that
+    doesn't fit is shortened and the rest left out
+    """
+    budget = max_prompt_tokens or get_prompt_budget()
+
+    # Base prompt; the query itself may use at most half the budget
+    head = f"User query: {truncate_to_tokens(query, budget // 2)}\n\n"
+    used = count_tokens(head) + count_tokens(INSTRUCTIONS)
+
+    # Add context from knowledge base matches in their ranked order; their
+    # 'similarity' scores aren't comparable once lexical matches are fused in
+    sections = []
+    truncated = 0
     if matches:
-        prompt += "Relevant information from knowledge base:\n\n"
-
-        for i, match in enumerate(matches):
-            if match["type"] == "faq":
-                prompt += f"FAQ {i+1} (Relevance: {match['similarity']:.2f}):\n"
-                prompt += f"Question: {match['data']['question']}\n"
-                prompt += f"Answer: {match['data']['answer']}\n\n"
-            else:  # complaint
-                prompt += f"Similar Issue {i+1} (Relevance: {match['similarity']:.2f}):\n"
-                prompt += f"Problem: {match['data']['description']}\n"
-                prompt += f"Solution: {match['data']['solution']}\n\n"
+        used += count_tokens(CONTEXT_HEADER)
+        for match in matches:
+            section = _format_match(len(sections) + 1, match)
+            tokens = count_tokens(section)
+            if used + tokens <= budget:
+                sections.append(section)
+                used += tokens
+                continue
+
+            # Shorten the answer/solution to whatever room is left
+            frame = count_tokens(_format_match(len(sections) + 1, match, ""))
+            room = budget - used - frame
+            if room >= MIN_TRUNCATED_TOKENS:
+                section = _format_match(
+                    len(sections) + 1, match,
+                    truncate_to_tokens(_long_field(match), room))
+                sections.append(section)
+                used += count_tokens(section)
+                truncated += 1
+            break
 
+    parts = [head]
+    if sections:
+        parts.append(CONTEXT_HEADER)
+        parts.extend(sections)
     # Add instructions for response generation
-    prompt += "Instructions:\n"
-    prompt += "1. Provide a helpful, concise response addressing the user's query.\n"
-    prompt += "2. Include specific details from the knowledge base when relevant.\n"
-    prompt += "3. If the query mentions specific products, highlight solutions for those products.\n"
-    prompt += "4. Format your response in a conversational, supportive tone.\n"
-    prompt += "5. If multiple solutions exist, prioritize the most effective one first.\n"
+    parts.append(INSTRUCTIONS)
+    prompt = "".join(parts)
+
+    record('prompt_tokens_estimate', used)
+    record('prompt_matches_used', len(sections))
+    record('prompt_matches_dropped', len(matches or []) - len(sections))
+    record('prompt_matches_truncated', truncated)
 
     return prompt
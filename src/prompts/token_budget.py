@@ -0,0 +1,92 @@
+"""
+Approximate token counting and per-model context budgets
+"""
+
+import re
+from src.utils.config import get_config
+
+# Context window (prompt + completion) in tokens for known model ids
+CONTEXT_WINDOWS = {
+    'llama3-8b-8192': 8192,
+    'llama3-70b-8192': 8192,
+    'mixtral-8x7b-32768': 32768,
+    'gemma-7b-it': 8192,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Tokens kept free for the system prompt, chat formatting and estimate error
+SAFETY_MARGIN = 256
+
+_PIECES = re.compile(r"\w+|[^\w\s]")
+_SENTENCES = re.compile(r"(?<=[.!?])\s+")
+
+
+def count_tokens(text):
+    """
+    Estimate the number of tokens in text without a model tokenizer:
+    each punctuation mark is a token and each word one token per six
+    characters, which is close to the Llama 3 tokenizer for English (most
+    common words are a single token)
+    """
+    return sum((len(piece) + 5) // 6 for piece in _PIECES.findall(text))
+
+
+def truncate_to_tokens(text, max_tokens):
+    """
+    Shorten text to about max_tokens, keeping whole sentences where
+    possible, then whole words. Returns the text unchanged if it fits.
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    # One token is left for the ellipsis
+    limit = max_tokens - 1
+    kept = []
+    used = 0
+    for sentence in _SENTENCES.split(text):
+        tokens = count_tokens(sentence)
+        if used + tokens > limit:
+            break
+        kept.append(sentence)
+        used += tokens
+
+    if not kept:
+        # The first sentence alone is too long; cut it by words
+        for word in text.split():
+            tokens = count_tokens(word)
+            if used + tokens > limit:
+                break
+            kept.append(word)
+            used += tokens
+
+    return " ".join(kept) + " …" if kept else ""
+
+
+def get_context_window(model_id, config=None):
+    """Context window for a model id (prompts.context_windows overrides)"""
+    config = config or get_config()
+    overrides = (config.get('prompts') or {}).get('context_windows') or {}
+    if model_id in overrides:
+        return overrides[model_id]
+    if model_id in CONTEXT_WINDOWS:
+        return CONTEXT_WINDOWS[model_id]
+    # Groq-style ids end with the window size, e.g. mixtral-8x7b-32768
+    match = re.search(r"-(\d{4,6})$", model_id or "")
+    return int(match.group(1)) if match else DEFAULT_CONTEXT_WINDOW
+
+
+def get_prompt_budget(model_ids=None, config=None):
+    """
+    Tokens available for the prompt: the smallest context window among
+    the models that may answer (any of them can be failed over to), less
+    the completion's max_tokens and a safety margin
+    """
+    config = config or get_config()
+    if model_ids is None:
+        model_ids = [section.get('model_id')
+                     for name, section in config['models'].items()
+                     if name in ('groq', 'ollama') and isinstance(section, dict)]
+    window = min((get_context_window(m, config) for m in model_ids),
+                 default=DEFAULT_CONTEXT_WINDOW)
+    max_tokens = (config.get('nlp') or {}).get('max_tokens', 1024)
+    return max(window - max_tokens - SAFETY_MARGIN, 0)
@@ -50,6 +50,9 @@ def extract_keywords(text, max_keywords=5):
     from collections import Counter
     from nltk.corpus import stopwords
     from nltk.tokenize import word_tokenize
+    from src.nlp.nltk_resources import ensure_resources
+
+    ensure_resources('punkt_tab', 'stopwords')
 
     # Tokenize and lowercase
     tokens = word_tokenize(text.lower())
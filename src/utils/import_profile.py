@@ -0,0 +1,109 @@
+"""
+Summarise Python import times for the chatbot's modules
+
+Runs a fresh interpreter with -X importtime and reports the slowest
+imports, so cold-start regressions can be tracked in CI:
+
+    python -m src.utils.import_profile --top 15 --max-ms 1500
+"""
+
+import argparse
+import json
+import re
+import subprocess
+import sys
+
+# Modules imported by app.py (which itself can't be imported outside Streamlit)
+DEFAULT_MODULES = [
+    "src.nlp.preprocessor",
+    "src.nlp.semantic_search",
+    "src.nlp.entity_extractor",
+    "src.nlp.sentiment",
+    "src.database.query",
+    "src.prompts.templates",
+    "src.feedback.evaluator",
+    "src.utils.config",
+    "src.utils.helpers",
+    "src.models.providers",
+    "src.models.resilience",
+]
+
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def profile_imports(modules=None):
+    """
+    Import modules in a fresh interpreter and parse its -X importtime output
+    Returns a list of dicts with self and cumulative time in ms per module
+    """
+    modules = modules or DEFAULT_MODULES
+    code = "; ".join(f"import {module}" for module in modules)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Import failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def parse_importtime(output):
+    """Parse -X importtime output (stderr) into per-module entries"""
+    entries = []
+    for line in output.splitlines():
+        match = _LINE.match(line)
+        if match:
+            entries.append({
+                "module": match.group(4),
+                "self_ms": int(match.group(1)) / 1000,
+                "cumulative_ms": int(match.group(2)) / 1000,
+                # Nesting depth in the import tree, 0 for top-level imports
+                "depth": (len(match.group(3)) - 1) // 2
+            })
+    return entries
+
+
+def summarise(entries, top=15):
+    """Total import time plus the slowest top-level packages and modules"""
+    total_ms = sum(entry["self_ms"] for entry in entries)
+
+    # Group by top-level package, e.g. all of torch.* together
+    packages = {}
+    for entry in entries:
+        package = entry["module"].split(".")[0]
+        packages[package] = packages.get(package, 0) + entry["self_ms"]
+
+    return {
+        "total_ms": total_ms,
+        "module_count": len(entries),
+        "slowest_packages": sorted(
+            ({"package": name, "self_ms": ms} for name, ms in packages.items()),
+            key=lambda p: p["self_ms"], reverse=True)[:top],
+        "slowest_modules": sorted(
+            entries, key=lambda e: e["self_ms"], reverse=True)[:top],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("modules", nargs="*", help="modules to import")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--json", action="store_true", help="print JSON for CI")
+    parser.add_argument("--max-ms", type=float, default=None,
+                        help="exit with an error if total import time exceeds this")
+    args = parser.parse_args()
+
+    summary = summarise(profile_imports(args.modules), args.top)
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(f"Total import time: {summary['total_ms']:.0f} ms "
+              f"({summary['module_count']} modules)\n")
+        print(f"{'package':<30} {'self ms':>10}")
+        for package in summary["slowest_packages"]:
+            print(f"{package['package']:<30} {package['self_ms']:>10.1f}")
+
+    if args.max_ms is not None and summary["total_ms"] > args.max_ms:
+        raise SystemExit(
+            f"Import time {summary['total_ms']:.0f} ms exceeds {args.max_ms:.0f} ms")
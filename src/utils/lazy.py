@@ -0,0 +1,77 @@
+"""
+Lazy construction of heavy singletons and background warm-up
+"""
+
+import threading
+import time
+
+
+class LazyProxy:
+    """
+    Stands in for an object that is expensive to build. The factory runs
+    on first attribute access (or get()), once, even with many threads.
+    """
+
+    def __init__(self, factory, name=None):
+        self._factory = factory
+        self._name = name or getattr(factory, '__name__', 'object')
+        self._instance = None
+        self._lock = threading.Lock()
+        self.load_seconds = None
+
+    def get(self):
+        """Get the underlying object, building it if needed"""
+        instance = self._instance
+        if instance is not None:
+            return instance
+
+        with self._lock:
+            if self._instance is None:
+                start = time.perf_counter()
+                self._instance = self._factory()
+                self.load_seconds = time.perf_counter() - start
+            return self._instance
+
+    @property
+    def loaded(self):
+        return self._instance is not None
+
+    def __getattr__(self, name):
+        # Only called for attributes not found on the proxy itself
+        return getattr(self.get(), name)
+
+    def __repr__(self):
+        state = 'loaded' if self.loaded else 'not loaded'
+        return f"<LazyProxy {self._name} ({state})>"
+
+
+# Warm-up state for the process
+_warmup_thread = None
+_warmup_lock = threading.Lock()
+warmup_errors = []
+
+
+def start_background_warmup(tasks):
+    """
+    Run warm-up tasks (callables) once per process in a daemon thread,
+    so heavy models load while the UI is already usable
+    Returns the thread, or None if warm-up was already started
+    """
+    global _warmup_thread
+
+    with _warmup_lock:
+        if _warmup_thread is not None:
+            return None
+
+        def run():
+            for task in tasks:
+                try:
+                    task()
+                except Exception as e:
+                    # Warm-up is best effort; the request path will retry
+                    warmup_errors.append(f"{getattr(task, '__name__', task)}: {e}")
+
+        _warmup_thread = threading.Thread(
+            target=run, name="chatbot-warmup", daemon=True)
+        _warmup_thread.start()
+        return _warmup_thread
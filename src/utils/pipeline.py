@@ -0,0 +1,139 @@
+"""
+Concurrent execution of independent pipeline stages
+"""
+
+import contextvars
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from src.utils.config import get_config
+
+# Shared worker pool, created on first use
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Get the process-wide thread pool for pipeline stages"""
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            pipeline_config = get_config().get('pipeline') or {}
+            _executor = ThreadPoolExecutor(
+                max_workers=pipeline_config.get('max_workers', 16),
+                thread_name_prefix="pipeline-stage")
+
+    return _executor
+
+
+class Stage:
+    def __init__(self, name, fn, deps=(), timeout=None, default=None):
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+        self.timeout = timeout
+        self.default = default
+
+
+def _run_stage(fn, started, *args):
+    """Run a stage on a worker, noting when it got one"""
+    started.append(time.perf_counter())
+    return fn(*args)
+
+
+class StageGraph:
+    """
+    A small DAG of stages. Each stage runs on the shared thread pool as
+    soon as its dependencies have finished and receives their results as
+    positional arguments. A stage that runs longer than its timeout, or
+    waits longer than queue_timeout for a free worker, is abandoned and its
+    default value used instead; exceptions are re-raised by run().
+    At most max_parallel stages of one graph run at a time, so a turn
+    can't take over the pool shared by all sessions.
+    """
+
+    def __init__(self, executor=None, max_parallel=None, queue_timeout=None):
+        pipeline_config = get_config().get('pipeline') or {}
+        self.executor = executor
+        self.max_parallel = max_parallel or pipeline_config.get(
+            'max_stages_per_turn', 4)
+        self.queue_timeout = queue_timeout or pipeline_config.get(
+            'stage_queue_timeout', 5)
+        self.stages = {}
+
+    def add(self, name, fn, deps=(), timeout=None, default=None):
+        """Add a stage; timeout is in seconds, None waits indefinitely"""
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError(f"Stage '{name}' depends on unknown stage '{dep}'")
+        self.stages[name] = Stage(name, fn, deps, timeout, default)
+        return self
+
+    def _deadline(self, stage, submitted, started):
+        """
+        When the stage is given up on: queue_timeout after it was submitted
+        while it waits for a worker, then its own timeout from when it started
+        """
+        if not started:
+            return submitted + self.queue_timeout
+        if stage.timeout is None:
+            return None
+        return started[0] + stage.timeout
+
+    def run(self):
+        """
+        Run all stages
+        Returns (results, report) where results maps stage name to its
+        result and report holds per-stage seconds and timed-out stages
+        """
+        executor = self.executor or get_executor()
+        results = {}
+        timings = {}
+        timed_out = []
+
+        pending = dict(self.stages)
+        running = {}
+
+        while pending or running:
+            # Start every stage whose dependencies are satisfied, up to
+            # max_parallel at a time
+            for name, stage in list(pending.items()):
+                if len(running) >= self.max_parallel:
+                    break
+                if all(dep in results for dep in stage.deps):
+                    args = [results[dep] for dep in stage.deps]
+                    # Run in a copy of the caller's context so tracing works
+                    context = contextvars.copy_context()
+                    started = []
+                    future = executor.submit(
+                        context.run, _run_stage, stage.fn, started, *args)
+                    running[future] = (stage, time.perf_counter(), started)
+                    del pending[name]
+
+            # Wait for the next stage to finish or the nearest deadline
+            deadlines = [self._deadline(*entry) for entry in running.values()]
+            deadlines = [d for d in deadlines if d is not None]
+            wait_for = (max(0, min(deadlines) - time.perf_counter())
+                        if deadlines else None)
+            done, _ = wait(running, timeout=wait_for, return_when=FIRST_COMPLETED)
+
+            now = time.perf_counter()
+            for future in done:
+                stage, submitted, started = running.pop(future)
+                timings[stage.name] = now - (started[0] if started else submitted)
+                # Propagate the stage's exception, as sequential code would
+                results[stage.name] = future.result()
+
+            for future, (stage, submitted, started) in list(running.items()):
+                deadline = self._deadline(stage, submitted, started)
+                if deadline is not None and now >= deadline:
+                    # Frees the worker if the stage hasn't started; a running
+                    # thread can't be killed, so its result is ignored
+                    future.cancel()
+                    running.pop(future)
+                    timings[stage.name] = now - (started[0] if started else submitted)
+                    timed_out.append(stage.name)
+                    results[stage.name] = stage.default
+
+        return results, {'timings': timings, 'timed_out': timed_out}
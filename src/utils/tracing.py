@@ -0,0 +1,121 @@
+"""
+Lightweight per-turn tracing for the chat pipeline
+
+A trace is started for each chat turn; code anywhere below it records
+spans with the span() context manager or the @traced decorator, and
+counters/values with record() and increment(). Without an active trace
+these calls do nothing.
+"""
+
+import contextvars
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+_current_trace = contextvars.ContextVar('current_trace', default=None)
+
+
+class Trace:
+    def __init__(self, name='turn'):
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans = []
+        self.attributes = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, name, seconds):
+        """Record a span that was timed elsewhere"""
+        with self._lock:
+            self.spans.append((name, seconds))
+
+    @contextmanager
+    def span(self, name):
+        """Time the enclosed block as a span"""
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add_span(name, time.perf_counter() - start)
+
+    def record(self, key, value):
+        """Record a value, e.g. token counts"""
+        with self._lock:
+            self.attributes[key] = value
+
+    def increment(self, key, amount=1):
+        """Increment a counter, e.g. cache hits"""
+        with self._lock:
+            self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def to_dict(self):
+        """Span durations in ms (summed per name), total time and attributes"""
+        with self._lock:
+            spans = {}
+            for name, seconds in self.spans:
+                spans[name] = spans.get(name, 0) + seconds * 1000
+            return {
+                'name': self.name,
+                'total_ms': (time.perf_counter() - self.started) * 1000,
+                'spans': spans,
+                'attributes': dict(self.attributes)
+            }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), default=str)
+
+
+def start_trace(name='turn'):
+    """Start a trace for the current context (thread or task)"""
+    trace = Trace(name)
+    _current_trace.set(trace)
+    return trace
+
+
+def end_trace():
+    """Stop recording into the current trace"""
+    _current_trace.set(None)
+
+
+def current_trace():
+    """Get the active trace, or None"""
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name):
+    """Time the enclosed block in the active trace, if any"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    with trace.span(name):
+        yield trace
+
+
+def traced(name=None):
+    """Decorator that records each call of the function as a span"""
+    def decorator(fn):
+        span_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record(key, value):
+    """Record a value in the active trace, if any"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.record(key, value)
+
+
+def increment(key, amount=1):
+    """Increment a counter in the active trace, if any"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.increment(key, amount)
@@ -0,0 +1,366 @@
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from src.database import connection, db_init, interaction_writer, query
+from src.utils import config as config_module
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """A freshly initialised database, set as the configured database"""
+    (tmp_path / "data").mkdir()
+    for name in ["products.json", "complaints.json", "faqs.json"]:
+        shutil.copy(os.path.join(DATA_DIR, name), tmp_path / "data" / name)
+
+    monkeypatch.chdir(tmp_path)
+    path = str(tmp_path / "data" / "industrial_knowledge.db")
+    monkeypatch.setattr(config_module, "_config", {
+        "models": {"default": "groq", "groq": {}, "ollama": {}},
+        "database": {"type": "sqlite", "path": path},
+        "nlp": {}
+    })
+    db_init.initialize_database().close()
+
+    monkeypatch.setattr(query, "_kb_snapshot", None)
+    monkeypatch.setattr(query, "_kb_data_version", None)
+    monkeypatch.setattr(query, "_kb_watch_conn", None)
+    monkeypatch.setattr(interaction_writer, "_interaction_writer", None)
+    yield path
+    if interaction_writer._interaction_writer is not None:
+        interaction_writer._interaction_writer.close()
+    connection.pool.close_all()
+
+
+def test_pooled_and_caller_owned_connections(db_path):
+    pooled = query.get_db_connection()
+    assert query.get_db_connection() is pooled
+
+    owned = query.open_db_connection()
+    assert owned is not pooled
+    # Caller-owned connections can be handed to another thread
+    counts = []
+    thread = threading.Thread(target=lambda: counts.append(
+        owned.execute("SELECT COUNT(*) FROM products").fetchone()[0]))
+    thread.start()
+    thread.join()
+    assert counts[0] > 0
+    owned.close()
+    assert pooled.execute("SELECT COUNT(*) FROM products").fetchone()[0] == counts[0]
+
+
+def test_knowledge_base_snapshot_is_shared_until_tables_change(db_path):
+    first = query.get_knowledge_base()
+    assert query.get_knowledge_base() is first
+
+    # Writes to other tables don't invalidate the snapshot
+    query.log_interaction("hello", "hi")
+    assert query.get_knowledge_base() is first
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE faqs SET answer = 'Updated answer' WHERE id = 1")
+    conn.commit()
+    conn.close()
+
+    second = query.get_knowledge_base()
+    assert second is not first
+    assert second["version"] > first["version"]
+    assert second["faqs"][0]["answer"] == "Updated answer"
+
+
+def test_log_interaction_stores_trace(db_path):
+    query.log_interaction("hello", "hi", trace={"spans": {"retrieval": 12.5}})
+    query.flush_interactions()
+
+    conn = sqlite3.connect(db_path)
+    stored = conn.execute("SELECT trace FROM interactions").fetchone()[0]
+    conn.close()
+
+    spans = json.loads(stored)["spans"]
+    assert spans["retrieval"] == 12.5
+    # Queuing the interaction is traced too
+    assert set(spans) == {"retrieval", "log_interaction"}
+    assert 0 <= spans["log_interaction"] < 1000
+
+
+def test_interaction_writer_batches_and_applies_back_pressure(db_path):
+    writer = interaction_writer.InteractionWriter(
+        db_path, batch_size=10, flush_interval=0.05, max_queue=5, put_timeout=0.01)
+
+    # Until the writer thread starts the queue fills up, then drops
+    writer.start = lambda: None
+    results = [writer.submit(f"q{i}", "a") for i in range(7)]
+    assert results == [True] * 5 + [False] * 2
+    assert writer.stats()["queue_depth"] == 5
+
+    del writer.start
+    for i in range(7, 12):
+        writer.submit(f"q{i}", "a")
+    writer.close()
+
+    stats = writer.stats()
+    assert stats["written"] == 10 and stats["dropped"] == 2
+    assert stats["queue_depth"] == 0
+    assert stats["batches"] < stats["written"]
+
+    conn = sqlite3.connect(db_path)
+    queries = [row[0] for row in conn.execute("SELECT query FROM interactions ORDER BY id")]
+    conn.close()
+    assert queries == [f"q{i}" for i in range(12) if i not in (5, 6)]
+
+
+def test_interaction_writer_flush_and_close_give_up_on_a_dead_thread(db_path, capsys):
+    release = threading.Event()
+    writer = interaction_writer.InteractionWriter(db_path, max_queue=2, put_timeout=0.01)
+    # A writer thread that never takes anything off the queue, then dies
+    writer._run = release.wait
+    writer.start()
+    assert writer.submit("q1", "a") and writer.submit("q2", "a")
+
+    # Still alive but stuck: both wait no longer than their timeouts
+    assert writer.flush(timeout=0.05) is False
+    writer.close(timeout=0.05)
+    assert "not written" in capsys.readouterr().out
+
+    release.set()
+    writer._thread.join()
+    assert writer.flush() is False
+    assert writer.stats()["dropped"] == 2 and writer.stats()["queue_depth"] == 0
+    assert "dropped 2 queued interactions" in capsys.readouterr().out
+
+    # A dead thread on submit: dropped straight away, not queued
+    writer = interaction_writer.InteractionWriter(db_path)
+    writer._run = lambda: None
+    writer.start()
+    writer._thread.join()
+    assert writer.submit("q3", "a") is False
+    assert writer.stats()["dropped"] == 1
+    writer.close()
+
+
+def test_wal_readers_never_block_the_writer(db_path):
+    """Long read transactions on other threads don't hold up commits"""
+    stop = threading.Event()
+    reads = []
+    errors = []
+
+    def reader():
+        conn = connection.get_connection(db_path)
+        try:
+            while not stop.is_set():
+                # Hold a read transaction open across the writer's commits
+                conn.execute("BEGIN")
+                reads.append(conn.execute("SELECT COUNT(*) FROM interactions").fetchone()[0])
+                time.sleep(0.1)
+                conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=reader) for _ in range(4)]
+    for thread in readers:
+        thread.start()
+
+    # Every reader has a transaction open before the writer starts
+    while len(reads) < len(readers) and not errors:
+        time.sleep(0.01)
+
+    # No busy wait: a commit blocked by the readers fails instead of waiting
+    conn = connection.connect(db_path, settings=dict(
+        connection.DEFAULT_SETTINGS, busy_timeout_ms=0))
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    commit_errors = []
+    for i in range(100):
+        try:
+            with conn:
+                conn.execute("INSERT INTO interactions (query, response) VALUES (?, ?)",
+                             (f"q{i}", "a"))
+        except sqlite3.OperationalError as e:
+            commit_errors.append(e)
+
+    stop.set()
+    for thread in readers:
+        thread.join()
+
+    assert not errors
+    assert commit_errors == []
+    assert reads and max(reads) <= 100
+    assert conn.execute("SELECT COUNT(*) FROM interactions").fetchone()[0] == 100
+    conn.close()
+
+
+def _query_plan(conn, sql, params=()):
+    return " ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+
+
+def test_migrations_bring_schema_up_to_date_and_indexes_are_used(db_path):
+    from src.database import migrations
+
+    conn = sqlite3.connect(db_path)
+    assert migrations.get_schema_version(conn) == migrations.LATEST_VERSION
+    assert migrations.migrate(conn) == []
+
+    # Fields from schema.py are stored with the sample data
+    assert conn.execute("SELECT price, launch_date FROM products WHERE id = 1").fetchone() \
+        == (149.99, "2023-05-15")
+    assert conn.execute("SELECT frequency FROM complaints WHERE id = 1").fetchone()[0] == 87
+
+    assert "USING INDEX idx_complaints_product" in _query_plan(
+        conn, "SELECT * FROM complaints WHERE product_id = ?", (1,))
+    assert "USING INDEX idx_faqs_product" in _query_plan(
+        conn, "SELECT * FROM faqs WHERE product_id = ?", (1,))
+    assert "USING COVERING INDEX idx_interactions_timestamp_feedback" in _query_plan(
+        conn,
+        "SELECT COUNT(*), COUNT(CASE WHEN feedback = 'positive' THEN 1 END) "
+        "FROM interactions WHERE timestamp >= ? AND timestamp < ?",
+        ("2024-01-01", "2024-02-01"))
+    conn.close()
+
+
+def test_migrating_the_shipped_database_leaves_existing_rows_alone(db_path, tmp_path):
+    from src.database import migrations
+
+    shipped = str(tmp_path / "shipped.db")
+    shutil.copy(os.path.join(DATA_DIR, "industrial_knowledge.db"), shipped)
+    conn = sqlite3.connect(shipped)
+    before = conn.execute("SELECT * FROM products ORDER BY id").fetchall()
+    conn.close()
+
+    # Run from a directory holding sample files: the migration must not read them
+    migrations.migrate_database(shipped)
+
+    conn = sqlite3.connect(shipped)
+    rows = conn.execute("SELECT * FROM products ORDER BY id").fetchall()
+    assert [row[:4] for row in rows] == before
+    assert {row[4:] for row in rows} == {(None, None)}
+    assert conn.execute("SELECT COUNT(*) FROM complaints WHERE frequency IS NOT NULL"
+                        ).fetchone()[0] == 0
+    assert "trace" in [row[1] for row in conn.execute("PRAGMA table_info(interactions)")]
+    conn.close()
+
+
+def test_writer_start_migrates_and_backfill_matches_writer_normalisation(tmp_path, monkeypatch):
+    from src.database import migrations
+
+    path = str(tmp_path / "old.db")
+    monkeypatch.setattr(config_module, "_config", {"database": {"path": path}})
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE products (id INTEGER PRIMARY KEY, name TEXT, category TEXT, description TEXT);
+        CREATE TABLE complaints (id INTEGER PRIMARY KEY, product_id INTEGER, issue_type TEXT,
+                                 description TEXT, solution TEXT);
+        CREATE TABLE faqs (id INTEGER PRIMARY KEY, product_id INTEGER, question TEXT,
+                           answer TEXT, category TEXT);
+    """)
+    db_init.create_interactions_table(conn.cursor())
+    migrations.migrate(conn, target=2)
+    with conn:
+        conn.execute("INSERT INTO interactions (timestamp, query) VALUES (?, ?)",
+                     ("2024-03-01 09:15:00", "  Reset\n the  HUB "))
+    conn.close()
+
+    writer = interaction_writer.InteractionWriter(path)
+    writer.start()
+    writer.submit("reset the hub", "Hold the button")
+    writer.close()
+
+    conn = sqlite3.connect(path)
+    assert migrations.get_schema_version(conn) == migrations.LATEST_VERSION
+    assert conn.execute(
+        "SELECT DISTINCT normalized_query FROM interactions").fetchall() == [("reset the hub",)]
+    conn.close()
+
+
+def test_rollups_follow_interaction_writes(db_path):
+    conn = sqlite3.connect(db_path)
+    rows = [("2024-03-01 09:15:00", "Reset  the hub", "reset the hub", None),
+            ("2024-03-01 09:40:00", "reset the HUB", "reset the hub", "positive"),
+            ("2024-03-02 14:05:00", "Bulb flickers", "bulb flickers", "negative")]
+    with conn:
+        conn.executemany(
+            "INSERT INTO interactions (timestamp, query, normalized_query, feedback) "
+            "VALUES (?, ?, ?, ?)", rows)
+        conn.execute("UPDATE interactions SET feedback = 'negative' WHERE query = 'Reset  the hub'")
+    conn.close()
+
+    daily = query.get_interaction_stats("2024-03-01", "2024-03-03")
+    assert [(d["period"], d["interaction_count"], d["positive_feedback"],
+             d["negative_feedback"]) for d in daily] == [
+        ("2024-03-01", 2, 1, 1), ("2024-03-02", 1, 0, 1)]
+    assert daily[1]["avg_query_length"] == len("Bulb flickers")
+
+    hourly = query.get_interaction_stats("2024-03-01", "2024-03-02", by="hour")
+    assert [(h["period"], h["interaction_count"]) for h in hourly] == [
+        ("2024-03-01 09:00:00", 2)]
+
+    assert query.get_top_queries("2024-03-01") == [
+        {"query": "reset the hub", "count": 2}, {"query": "bulb flickers", "count": 1}]
+    assert query.get_top_queries("2024-03-02") == [{"query": "bulb flickers", "count": 1}]
+
+
+def test_stage_latency_rollups_follow_traced_interactions(db_path):
+    traces = [{"total_ms": 100 * (i + 1), "spans": {"llm": 90 * (i + 1)},
+               "attributes": {"prompt_tokens": 100, "response_cache_hit": i == 0}}
+              for i in range(10)]
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.executemany(
+            "INSERT INTO interactions (timestamp, query, trace) VALUES (?, ?, ?)",
+            [("2024-03-01 09:00:00", "q", json.dumps(t)) for t in traces]
+            + [("2024-03-01 10:00:00", "q", "not json"), ("2024-03-02 10:00:00", "q", None)])
+    conn.close()
+
+    latency = {s["stage"]: s for s in query.get_stage_latency("2024-03-01")}
+    assert set(latency) == {"llm", "total"}
+    assert latency["total"]["samples"] == 10
+    # Bucket upper bounds: never below the true percentile, at most 25% above
+    for stage, step in [("llm", 90), ("total", 100)]:
+        assert step * 5 <= latency[stage]["p50"] <= step * 5 * 1.25
+        assert step * 10 <= latency[stage]["p99"] <= step * 10 * 1.25
+
+    daily = query.get_stage_latency("2024-03-01", quantiles=(0.95,), by_day=True)
+    assert [(d["day"], d["stage"]) for d in daily] == [
+        ("2024-03-01", "llm"), ("2024-03-01", "total")]
+
+    stats = query.get_trace_stats("2024-03-01")
+    assert stats["turns"] == 10
+    assert stats["avg_prompt_tokens"] == 100
+    assert stats["avg_completion_tokens"] is None
+    assert stats["cache_hit_rate"] == pytest.approx(0.1)
+
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute("DELETE FROM interactions WHERE trace IS NOT NULL")
+    conn.close()
+    assert query.get_stage_latency("2024-03-01") == []
+    assert query.get_trace_stats("2024-03-01")["turns"] == 0
+
+
+def test_full_text_search_ranks_and_follows_writes(db_path):
+    results = query.search("reset button hub")
+    assert results and results == sorted(results, key=lambda r: r["score"], reverse=True)
+    assert {r["type"] for r in results} <= {"faq", "complaint", "product"}
+    top = results[0]
+    assert "reset" in (top["data"].get("answer") or top["data"].get("solution") or "").lower()
+
+    # FTS syntax in user input is treated as plain words
+    assert query.search('hub" OR NEAR(') == query.search("hub or near")
+
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute("INSERT INTO interactions (query, response) VALUES (?, ?)",
+                     ("gearbox whining", "Check the gearbox oil level"))
+    found = query.search("gearbox", sources=["interactions"])
+    assert [r["data"]["query"] for r in found] == ["gearbox whining"]
+
+    with conn:
+        conn.execute("UPDATE interactions SET response = 'Replace the bearing'")
+    assert query.search("oil", sources=["interactions"]) == []
+    assert query.search("bearing", sources=["interactions"])[0]["type"] == "interaction"
+    conn.close()
@@ -0,0 +1,393 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from src.feedback.evaluator import evaluate_response, evaluate_response_stream
+from src.models.response_cache import ResponseCache
+
+
+def test_evaluate_response_stream_matches_evaluate_response():
+    query = "My machine keeps overheating"
+    chunks = ["The unit ", "overheats when ", "vents are blocked."]
+
+    streamed = list(evaluate_response_stream(query, chunks))
+
+    assert streamed[:3] == chunks
+    assert "".join(streamed) == evaluate_response(query, "".join(chunks))
+
+
+def _match(id, answer="Hold the button for 10 seconds."):
+    return {"type": "faq", "id": id, "similarity": 0.9,
+            "data": {"id": id, "question": "How do I reset?", "answer": answer}}
+
+
+def test_response_cache_hits_near_duplicate_with_same_matches():
+    cache = ResponseCache(similarity_threshold=0.95)
+    cache.store([1.0, 0.0], [_match(1)], "cached answer")
+
+    assert cache.lookup([0.99, 0.05], [_match(1)]) == "cached answer"
+    assert cache.lookup([0.0, 1.0], [_match(1)]) is None
+    assert cache.lookup([1.0, 0.0], [_match(2)]) is None
+
+
+def test_response_cache_invalidates_when_matched_row_changes():
+    cache = ResponseCache()
+    cache.store([1.0, 0.0], [_match(1)], "cached answer")
+
+    assert cache.lookup([1.0, 0.0], [_match(1, answer="New procedure")]) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_response_cache_drops_entries_when_knowledge_base_rows_change():
+    cache = ResponseCache()
+
+    def snapshot(version, answer):
+        return {"version": version, "complaints": [],
+                "faqs": [_match(1, answer)["data"], _match(2)["data"]]}
+
+    cache.sync_knowledge_base(snapshot(1, "Hold the button for 10 seconds."))
+    cache.store([1.0, 0.0], [_match(1)], "answer from faq 1")
+    cache.store([1.0, 0.0], [_match(2)], "answer from faq 2")
+
+    cache.sync_knowledge_base(snapshot(2, "New procedure"))
+    assert cache.stats()["size"] == 1
+    assert cache.lookup([1.0, 0.0], [_match(2)]) == "answer from faq 2"
+
+
+def test_response_cache_expires_and_evicts():
+    cache = ResponseCache(ttl_seconds=-1)
+    cache.store([1.0, 0.0], [_match(1)], "stale")
+    assert cache.lookup([1.0, 0.0], [_match(1)]) is None
+
+    cache = ResponseCache(max_entries=1)
+    cache.store([1.0, 0.0], [_match(1)], "first")
+    cache.store([1.0, 0.0], [_match(2)], "second")
+    assert cache.lookup([1.0, 0.0], [_match(1)]) is None
+    assert cache.lookup([1.0, 0.0], [_match(2)]) == "second"
+
+
+class _StubLLMHandler(BaseHTTPRequestHandler):
+    """Minimal Ollama and Groq (OpenAI-style) endpoints"""
+    protocol_version = "HTTP/1.1"
+    delay = 0.0
+    in_flight = 0
+    max_in_flight = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        cls = type(self)
+        with cls.lock:
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        try:
+            time.sleep(cls.delay)
+            if self.path == "/api/generate":
+                lines = [{"response": "Hello ", "done": False},
+                         {"response": "there", "done": True,
+                          "prompt_eval_count": 5, "eval_count": 2}]
+                payload = (b"\n".join(json.dumps(l).encode() for l in lines)
+                           if body["stream"] else
+                           json.dumps({"response": "Hello there",
+                                       "prompt_eval_count": 5,
+                                       "eval_count": 2}).encode())
+            else:
+                assert self.headers["Authorization"] == "Bearer test-key"
+                if body["stream"]:
+                    events = [{"choices": [{"delta": {"content": "Hello "}}]},
+                              {"choices": [{"delta": {"content": "there"}}],
+                               "x_groq": {"usage": {"prompt_tokens": 5,
+                                                    "completion_tokens": 2}}}]
+                    payload = b"".join(b"data: " + json.dumps(e).encode() + b"\n\n"
+                                       for e in events) + b"data: [DONE]\n\n"
+                else:
+                    payload = json.dumps({
+                        "choices": [{"message": {"content": "Hello there"}}],
+                        "usage": {"prompt_tokens": 5, "completion_tokens": 2}
+                    }).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        finally:
+            with cls.lock:
+                cls.in_flight -= 1
+
+
+@pytest.fixture
+def llm_server():
+    pytest.importorskip("httpx")
+    handler = type("Handler", (_StubLLMHandler,),
+                   {"in_flight": 0, "max_in_flight": 0, "lock": threading.Lock()})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", handler
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize("provider_name", ["ollama", "groq"])
+def test_provider_generate_and_stream(llm_server, provider_name):
+    from src.models import providers
+    from src.utils.tracing import start_trace, end_trace
+
+    url, _ = llm_server
+    provider = providers.PROVIDER_TYPES[provider_name](
+        "test-model", url, api_key="test-key")
+
+    trace = start_trace()
+    try:
+        assert providers.run_generate("Hi", provider) == "Hello there"
+        assert list(providers.run_stream("Hi", provider)) == ["Hello ", "there"]
+    finally:
+        end_trace()
+    assert trace.attributes["prompt_tokens"] == 5
+    assert trace.attributes["completion_tokens"] == 2
+
+
+def test_groq_api_key_falls_back_to_environment(llm_server, monkeypatch):
+    from src.models import providers
+
+    url, _ = llm_server
+    config = {"models": {"groq": {"base_url": url}}}
+    monkeypatch.setenv("GROQ_API_KEY", "test-key")
+    provider = providers.create_provider("groq", config)
+
+    assert provider.api_key is None
+    assert providers.run_generate("Hi", provider) == "Hello there"
+
+    config["models"]["groq"]["api_key"] = "config-key"
+    assert providers.create_provider("groq", config)._headers() == {
+        "Authorization": "Bearer config-key"}
+
+
+def test_provider_limits_concurrency_and_times_out(llm_server):
+    import asyncio
+    from src.models import providers
+
+    url, handler = llm_server
+    handler.delay = 0.1
+    provider = providers.OllamaProvider("test-model", url, max_concurrency=2)
+
+    async def burst():
+        return await asyncio.gather(*(provider.generate("Hi") for _ in range(6)))
+
+    assert providers.run_coroutine(burst()) == ["Hello there"] * 6
+    assert handler.max_in_flight == 2
+
+    with pytest.raises(providers.ProviderTimeout):
+        providers.run_generate("Hi", provider, timeout=0.02)
+
+    # Waiting for a slot counts toward the timeout: the second request
+    # would finish in time once it got the slot, but not counting the wait
+    single = providers.OllamaProvider("test-model", url, max_concurrency=1)
+
+    async def queued(stream):
+        async def second():
+            if stream:
+                return [chunk async for chunk in single.stream("Hi", timeout=0.15)]
+            return await single.generate("Hi", timeout=0.15)
+
+        first = asyncio.ensure_future(single.generate("Hi"))
+        await asyncio.sleep(0.02)
+        try:
+            with pytest.raises(providers.ProviderTimeout):
+                await second()
+        finally:
+            await first
+
+    providers.run_coroutine(queued(stream=False))
+    providers.run_coroutine(queued(stream=True))
+
+
+@pytest.fixture
+def resilience():
+    pytest.importorskip("httpx")
+    from src.models import resilience
+    return resilience
+
+
+class _ScriptedProvider:
+    """Fails with the scripted errors, then answers"""
+
+    def __init__(self, name, errors=()):
+        self.name = name
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def generate(self, prompt, timeout=None, on_usage=None, **options):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return f"{self.name} answer"
+
+    async def stream(self, prompt, timeout=None, on_usage=None, **options):
+        yield await self.generate(prompt)
+
+
+def test_circuit_breaker_opens_and_recovers(resilience):
+    now = [0.0]
+    breaker = resilience.CircuitBreaker(
+        failure_threshold=2, reset_seconds=10, clock=lambda: now[0])
+
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    now[0] = 10.0
+    assert breaker.allow()       # one half-open trial
+    assert not breaker.allow()
+    breaker.record_failure()     # trial failed, open again
+    assert not breaker.allow()
+
+    now[0] = 20.0
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_cancelled_half_open_trial_is_released(resilience):
+    import asyncio
+
+    class HangingProvider(_ScriptedProvider):
+        async def generate(self, prompt, timeout=None, on_usage=None, **options):
+            await asyncio.sleep(10)
+
+        async def stream(self, prompt, timeout=None, on_usage=None, **options):
+            yield "partial"
+            await asyncio.sleep(10)
+
+    now = [0.0]
+    breaker = resilience.CircuitBreaker(
+        failure_threshold=1, reset_seconds=10, clock=lambda: now[0])
+    llm = resilience.ResilientLLM(
+        [HangingProvider("groq")], breakers={"groq": breaker})
+    breaker.record_failure()
+    now[0] = 10.0
+
+    async def cancel_generate():
+        task = asyncio.create_task(llm.generate("Hi"))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_generate())
+    assert breaker.allow()       # the cancelled trial no longer blocks one
+    breaker.record_cancelled()
+
+    async def close_stream():
+        stream = llm.stream("Hi")
+        assert await stream.__anext__() == "partial"
+        await stream.aclose()
+
+    asyncio.run(close_stream())
+    assert breaker.allow()
+    assert breaker.failures == 1  # neither counted as a failure
+
+
+def test_resilient_llm_retries_then_fails_over(resilience):
+    import asyncio
+    from src.models.providers import RateLimitError, RequestRejected
+
+    groq = _ScriptedProvider("groq", [
+        RateLimitError("slow down", "groq", 429, retry_after=0),
+        RequestRejected("bad key", "groq", 401)])
+    ollama = _ScriptedProvider("ollama")
+    llm = resilience.ResilientLLM(
+        [groq, ollama], resilience.RetryPolicy(max_attempts=3, base_delay=0))
+
+    events = []
+    answer = asyncio.run(llm.generate(
+        "Hi", on_event=lambda name, value: events.append((name, value))))
+
+    # 429 is retried, 401 isn't, so the request moves on to ollama
+    assert answer == "ollama answer"
+    assert groq.calls == 2
+    assert events == [("retry", "groq"), ("failover", "ollama"),
+                      ("provider", "ollama")]
+    # Only the 429 counts toward groq's breaker, not the rejected request
+    assert llm.stats()["groq"]["failures"] == 1
+
+    ollama.errors = [RequestRejected("no model", "ollama", 404)]
+    groq.errors = [RequestRejected("bad key", "groq", 401)]
+    with pytest.raises(resilience.AllProvidersFailed):
+        asyncio.run(llm.generate("Hi"))
+    assert llm.stats() == {"groq": {"state": "closed", "failures": 1},
+                           "ollama": {"state": "closed", "failures": 0}}
+
+
+def test_single_flight_coalesces_identical_prompts():
+    import asyncio
+    from src.models.single_flight import SingleFlightLLM
+
+    class SlowLLM:
+        calls = 0
+
+        async def stream(self, prompt, **kwargs):
+            SlowLLM.calls += 1
+            for chunk in ["Reset ", "the ", "breaker."]:
+                await asyncio.sleep(0.01)
+                yield chunk
+
+        async def generate(self, prompt, **kwargs):
+            return "".join([c async for c in self.stream(prompt)])
+
+    llm = SingleFlightLLM(SlowLLM(), params=("groq", "llama3-8b-8192"))
+
+    async def collect(prompt):
+        return [chunk async for chunk in llm.stream(prompt)]
+
+    async def burst():
+        return await asyncio.gather(
+            collect("Q"), collect("Q"), llm.generate("Q"), collect("other"))
+
+    streamed, joined, generated, other = asyncio.run(burst())
+
+    assert streamed == joined == ["Reset ", "the ", "breaker."]
+    assert generated == "Reset the breaker."
+    assert other == streamed
+    assert SlowLLM.calls == 2
+    assert llm.stats() == {"requests": 4, "deduplicated": 2, "in_flight": 0}
+
+
+def test_enhanced_prompt_packs_best_matches_within_budget():
+    from src.prompts.templates import create_enhanced_prompt
+    from src.prompts.token_budget import count_tokens
+    from src.utils.tracing import start_trace, end_trace
+
+    long_solution = "Replace the seal and check the pressure. " * 200
+    matches = [
+        {"type": "faq", "similarity": 0.5,
+         "data": {"question": "How do I reset?", "answer": "Hold the button."}},
+        {"type": "complaint", "similarity": 0.6,
+         "data": {"description": "Leaking", "solution": long_solution}},
+        {"type": "complaint", "similarity": 0.4,
+         "data": {"description": "Noisy", "solution": "Tighten the fan."}},
+    ]
+
+    trace = start_trace()
+    try:
+        prompt = create_enhanced_prompt("Pump is leaking", matches,
+                                        max_prompt_tokens=400)
+    finally:
+        end_trace()
+
+    assert count_tokens(prompt) <= 400
+    # Input order is kept even where scores disagree (fused rankings); the
+    # long solution is cut and the last match dropped
+    assert prompt.index("FAQ 1") < prompt.index("Similar Issue 2")
+    assert "Noisy" not in prompt
+    assert prompt.endswith("prioritize the most effective one first.\n")
+    assert trace.attributes["prompt_matches_used"] == 2
+    assert trace.attributes["prompt_matches_truncated"] == 1
+    assert trace.attributes["prompt_tokens_estimate"] == count_tokens(prompt)
@@ -0,0 +1,484 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("sklearn")
+
+from src.nlp.embedding_cache import EmbeddingCache
+from src.nlp.matcher import TermMatcher
+from src.nlp.topk import TopKScorer, select_top_k
+from src.nlp.vector_index import (BruteForceIndex, IVFIndex,
+                                  benchmark_recall, create_index)
+
+
+def _matcher(*terms, whole_word=True):
+    matcher = TermMatcher()
+    for term in terms:
+        matcher.add(term, whole_word=whole_word)
+    return matcher.build()
+
+
+def test_term_matcher_finds_all_terms_with_offsets():
+    matcher = _matcher("pump", "pump motor", "motor")
+
+    found = matcher.find_all("the pump motor hums")
+
+    assert sorted(found) == [(4, 8, 0), (4, 14, 1), (9, 14, 2)]
+
+
+def test_term_matcher_respects_word_boundaries():
+    matcher = _matcher("fail", "now", "doesn't work")
+
+    assert matcher.find_terms("it failed and is unknown") == set()
+    assert matcher.find_terms("fail now, it doesn't work!") == {0, 1, 2}
+
+
+def test_term_matcher_substring_terms_ignore_boundaries():
+    matcher = _matcher("smartbulb", whole_word=False)
+
+    assert matcher.find_terms("my smartbulbs flicker") == {0}
+
+
+def _clustered_data(n, dim=32, clusters=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    labels = rng.integers(0, clusters, n)
+    return (centers[labels] + 0.3 * rng.normal(size=(n, dim))).astype(np.float32)
+
+
+def test_brute_force_returns_best_match_first():
+    corpus = _clustered_data(200)
+    index = BruteForceIndex().build(corpus)
+
+    results = index.search(corpus[17], top_k=3)
+
+    assert results[0][0] == 17
+    assert len(results) == 3
+    assert results[0][1] >= results[1][1] >= results[2][1]
+
+
+def test_ivf_probing_every_list_is_exact():
+    corpus = _clustered_data(500)
+    query = corpus[3] + 0.01
+    exact = BruteForceIndex().build(corpus).search(query, top_k=5)
+
+    ivf = IVFIndex(nlist=16, nprobe=16).build(corpus)
+    approx = ivf.search(query, top_k=5)
+
+    assert [idx for idx, _ in approx] == [int(idx) for idx, _ in exact]
+
+
+def test_ivf_recall_improves_with_nprobe():
+    data = _clustered_data(2050)
+    results = benchmark_recall(data[:2000], data[2000:], top_k=5,
+                               nlist=32, nprobe_values=(1, 32))
+
+    assert results[-1]["recall"] == pytest.approx(1.0)
+    assert results[0]["recall"] <= results[-1]["recall"]
+    assert results[0]["recall"] > 0.5
+
+
+def test_create_index_rejects_unknown_type():
+    with pytest.raises(ValueError):
+        create_index("hnsw")
+
+
+def test_select_top_k_matches_full_sort():
+    scores = np.random.default_rng(1).normal(size=(4, 100))
+
+    top = select_top_k(scores, 5)
+
+    expected = np.argsort(-scores, axis=1)[:, :5]
+    assert (top == expected).all()
+
+
+def test_batch_search_matches_single_queries():
+    corpus = _clustered_data(300)
+    queries = _clustered_data(6, seed=2)
+    scorer = TopKScorer(corpus)
+
+    batched = scorer.search_batch(queries, top_k=4)
+
+    for query, found in zip(queries, batched):
+        single = scorer.search(query, top_k=4)
+        assert [idx for idx, _ in found] == [idx for idx, _ in single]
+        assert [s for _, s in found] == pytest.approx([s for _, s in single], abs=1e-5)
+
+
+class _CountingModel:
+    """Stub encoder: [len(text), 1] per text, for one text or a list"""
+
+    def __init__(self):
+        self.calls = 0
+        self.texts = []
+
+    def encode(self, text):
+        self.calls += 1
+        if isinstance(text, list):
+            self.texts.extend(text)
+            return np.array([[len(t), 1.0] for t in text], dtype=np.float32)
+        self.texts.append(text)
+        return np.array([len(text), 1.0], dtype=np.float32)
+
+
+def test_embedding_cache_normalises_queries_and_counts_hits():
+    model = _CountingModel()
+    cache = EmbeddingCache(max_size=2)
+
+    cache.get_or_encode(model, "m", "Reset my  SmartBulb")
+    cache.get_or_encode(model, "m", "reset my smartbulb ")
+
+    assert model.calls == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_embedding_cache_evicts_least_recently_used():
+    model = _CountingModel()
+    cache = EmbeddingCache(max_size=2)
+
+    for text in ["a", "b", "a", "c"]:
+        cache.get_or_encode(model, "m", text)
+
+    assert cache.get("m", "a") is not None
+    assert cache.get("m", "b") is None
+
+
+def test_embedding_cache_persists_to_disk_in_batches(tmp_path):
+    model = _CountingModel()
+    path = str(tmp_path / "cache.db")
+    cache = EmbeddingCache(persist_path=path, write_batch_size=2, write_interval=60)
+
+    cache.get_or_encode(model, "m", "hello")
+    assert EmbeddingCache(persist_path=path).get("m", "hello") is None
+    cache.get_or_encode(model, "m", "world")  # fills the batch
+    cache.get_or_encode(model, "m", "again")
+    cache.flush()
+
+    restarted = EmbeddingCache(persist_path=path)
+    vector = restarted.get_or_encode(model, "m", "hello")
+    assert restarted.get("m", "again") is not None
+    assert model.calls == 3
+    assert vector.tolist() == [5.0, 1.0]
+
+
+def test_embedding_index_only_encodes_changed_rows():
+    from src.nlp.embedding_index import EmbeddingIndex
+
+    model = _CountingModel()
+    index = EmbeddingIndex(model, "m")
+    first = index.sync(["faq:1", "faq:2", "faq:3"], ["a", "bb", "ccc"]).copy()
+    assert model.texts == ["a", "bb", "ccc"]
+
+    # Unchanged rows: nothing encoded, same version
+    version = index.version
+    index.sync(["faq:1", "faq:2", "faq:3"], ["a", "bb", "ccc"])
+    assert model.calls == 1 and index.version == version
+
+    # An edited row is patched in place
+    patched = index.sync(["faq:1", "faq:2", "faq:3"], ["a", "bbbb", "ccc"])
+    assert model.texts[3:] == ["bbbb"]
+    assert patched.tolist() == [[1, 1], [4, 1], [3, 1]]
+    assert index.last_encoded == 1 and index.version > version
+
+    # Inserted and deleted rows are merged around the reused vectors
+    merged = index.sync(["faq:1", "faq:3", "faq:4"], ["a", "ccc", "dddddd"])
+    assert model.texts[4:] == ["dddddd"]
+    assert merged.tolist() == [first[0].tolist(), first[2].tolist(), [6, 1]]
+    assert (index.last_encoded, index.last_removed) == (1, 1)
+
+
+def test_embedding_index_reloads_from_disk_for_the_same_model(tmp_path):
+    from src.nlp.embedding_index import EmbeddingIndex
+
+    path = str(tmp_path / "kb.embeddings.npz")
+    keys, texts = ["faq:1", "complaint:2"], ["reset", "leak"]
+    saved = EmbeddingIndex(_CountingModel(), "model-a", path=path).sync(keys, texts)
+
+    model = _CountingModel()
+    reloaded = EmbeddingIndex(model, "model-a", path=path).sync(keys, texts)
+    assert model.calls == 0
+    assert reloaded.tolist() == saved.tolist()
+
+    # Vectors from another model aren't reused
+    other = _CountingModel()
+    EmbeddingIndex(other, "model-b", path=path).sync(keys, texts)
+    assert other.texts == texts
+
+
+def test_entity_extractor_is_reused_until_the_knowledge_base_changes(monkeypatch):
+    from src.nlp import entity_extractor as module
+    from src.utils.lazy import LazyProxy
+
+    monkeypatch.setattr(module, "entity_extractor", LazyProxy(module.EntityExtractor))
+    # Skip the NLTK part; only the vocabulary matching is under test
+    monkeypatch.setattr(module.EntityExtractor, "extract_entities",
+                        lambda self, query: self.find_mentions(query))
+
+    def products(mentions):
+        return [m["text"] for m in mentions if m["type"] == "products"]
+
+    kb = {"version": 1, "products": [{"name": "SmartBulb"}]}
+    assert products(module.extract_entities_from_query("my SmartBulb", kb)) == ["smartbulb"]
+    matcher = module.entity_extractor.matcher
+    module.extract_entities_from_query("another SmartBulb", kb)
+    assert module.entity_extractor.matcher is matcher
+
+    kb = {"version": 2, "products": [{"name": "HubMax"}]}
+    assert products(module.extract_entities_from_query("my HubMax", kb)) == ["hubmax"]
+    assert module.entity_extractor.matcher is not matcher
+
+    module.refresh_entity_extractor({"version": 3, "products": []})
+    assert module.entity_extractor.product_names == []
+    assert module.entity_extractor.kb_version == 3
+
+
+def test_model_registry_shares_one_model_per_name_and_device(monkeypatch):
+    import sys
+    import threading
+    import types
+    from src.nlp import model_registry
+
+    loaded = []
+
+    class SentenceTransformer:
+        def __init__(self, model_name, device=None):
+            loaded.append((model_name, device))
+            self.device = device or "cpu"
+
+        def parameters(self):
+            return []
+
+    monkeypatch.setitem(sys.modules, "sentence_transformers",
+                        types.SimpleNamespace(SentenceTransformer=SentenceTransformer))
+    monkeypatch.setattr(model_registry, "_models", {})
+    monkeypatch.setattr(model_registry, "_model_stats", {})
+
+    models = []
+    threads = [threading.Thread(target=lambda: models.append(
+        model_registry.get_sentence_model("stub", "cpu"))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert loaded == [("stub", "cpu")]
+    assert all(model is models[0] for model in models)
+    assert model_registry.get_sentence_model("stub", "cuda") is not models[0]
+    assert [s["device"] for s in model_registry.get_model_stats()] == ["cpu", "cuda"]
+
+
+def test_sentiment_lexicon_counts_match_regex_search():
+    pytest.importorskip("textblob")
+    import re
+    from src.nlp.sentiment import SentimentAnalyzer
+
+    analyzer = SentimentAnalyzer()
+    texts = [
+        "The pump isn't working and it failed again, need help right away!",
+        "Thanks, the fix works great now",
+        "NOT a life-threatening problem, but frustrating",
+        "",
+    ]
+
+    for text, result in zip(texts, analyzer.analyze_batch(texts)):
+        for lexicon, key in [(analyzer.positive_terms, 'positive_terms'),
+                             (analyzer.negative_terms, 'negative_terms'),
+                             (analyzer.urgent_terms, 'urgent_terms')]:
+            expected = sum(1 for term in lexicon if re.search(
+                r'\b' + re.escape(term) + r'\b', text.lower()))
+            assert result[key] == expected
+        assert result == analyzer.analyze_sentiment(text)
+
+
+def test_nltk_resources_are_not_downloaded_when_disabled(monkeypatch):
+    nltk = pytest.importorskip("nltk")
+    from src.nlp import nltk_resources
+    from src.utils import config as config_module
+
+    monkeypatch.setattr(config_module, "_config", {
+        "nlp": {"nltk_auto_download": False}})
+
+    def fail_download(*args, **kwargs):
+        raise AssertionError("nltk.download must not be called")
+
+    monkeypatch.setattr(nltk, "download", fail_download)
+
+    with pytest.raises(LookupError):
+        nltk_resources.ensure_resources("not_a_real_resource")
+
+
+def test_stage_graph_runs_independent_stages_concurrently():
+    import threading
+    from src.utils.pipeline import StageGraph
+
+    barrier = threading.Barrier(3, timeout=5)
+
+    def stage(value):
+        barrier.wait()  # only passes if all three run at the same time
+        return value
+
+    graph = StageGraph()
+    for name in ["a", "b", "c"]:
+        graph.add(name, lambda name=name: stage(name))
+    graph.add("joined", lambda a, b, c: a + b + c, deps=["a", "b", "c"])
+
+    results, report = graph.run()
+
+    assert results["joined"] == "abc"
+    assert report["timed_out"] == []
+
+
+def test_stage_graph_uses_default_when_stage_times_out():
+    import time
+    from src.utils.pipeline import StageGraph
+
+    graph = StageGraph()
+    graph.add("slow", lambda: time.sleep(1) or "late", timeout=0.05, default="fallback")
+    graph.add("fast", lambda: "ok")
+
+    start = time.perf_counter()
+    results, report = graph.run()
+
+    assert time.perf_counter() - start < 0.5
+    assert results == {"slow": "fallback", "fast": "ok"}
+    assert report["timed_out"] == ["slow"]
+
+
+def test_stage_graph_times_stages_from_when_they_start():
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from src.utils.pipeline import StageGraph
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # "quick" waits for the only worker, but only its run time counts
+        graph = StageGraph(executor=executor, queue_timeout=5)
+        graph.add("slow", lambda: time.sleep(0.2) or "done")
+        graph.add("quick", lambda: "ok", timeout=0.1, default="fallback")
+        results, report = graph.run()
+        assert results == {"slow": "done", "quick": "ok"}
+        assert report["timed_out"] == []
+
+        # ...while waiting for a worker is bounded by queue_timeout
+        graph = StageGraph(executor=executor, queue_timeout=0.05)
+        graph.add("slow", lambda: time.sleep(0.2) or "done")
+        graph.add("quick", lambda: "ok", timeout=0.1, default="fallback")
+        results, report = graph.run()
+        assert results == {"slow": "done", "quick": "fallback"}
+        assert report["timed_out"] == ["quick"]
+
+
+def test_stage_graph_limits_stages_running_at_once():
+    import threading
+    import time
+    from src.utils.pipeline import StageGraph
+
+    lock = threading.Lock()
+    running = [0, 0]  # now, most at once
+
+    def stage():
+        with lock:
+            running[0] += 1
+            running[1] = max(running[1], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+
+    graph = StageGraph(max_parallel=2)
+    for name in "abcde":
+        graph.add(name, stage)
+    results, _ = graph.run()
+
+    assert set(results) == set("abcde")
+    assert running[1] == 2
+
+
+def test_stage_graph_propagates_stage_errors():
+    from src.utils.pipeline import StageGraph
+
+    graph = StageGraph().add("broken", lambda: 1 / 0)
+
+    with pytest.raises(ZeroDivisionError):
+        graph.run()
+
+
+def test_trace_collects_spans_from_pipeline_stages():
+    from src.utils.pipeline import StageGraph
+    from src.utils.tracing import end_trace, increment, start_trace, traced
+
+    @traced("lookup")
+    def lookup():
+        increment("cache_hits")
+        return "found"
+
+    trace = start_trace()
+    try:
+        StageGraph().add("lookup", lookup).run()
+    finally:
+        end_trace()
+
+    recorded = trace.to_dict()
+    assert "lookup" in recorded["spans"]
+    assert recorded["attributes"] == {"cache_hits": 1}
+
+
+def test_merge_matches_fuses_semantic_and_lexical_rankings():
+    from src.nlp.lexical_search import merge_matches
+
+    def match(type, id, similarity):
+        return {"type": type, "id": id, "similarity": similarity, "data": {}}
+
+    semantic = [match("faq", 1, 0.8), match("faq", 2, 0.7), match("complaint", 3, 0.6)]
+    lexical = [match("complaint", 3, 0.9), match("faq", 4, 0.5)]
+
+    merged = merge_matches(semantic, lexical, top_k=3)
+
+    # Found by both lists, so ranked first, keeping the semantic entry
+    assert merged[0] is semantic[2]
+    assert [(m["type"], m["id"]) for m in merged] == [
+        ("complaint", 3), ("faq", 1), ("faq", 2)]
+
+
+def test_importing_the_app_modules_loads_no_heavy_dependencies():
+    import json
+    import os
+    import subprocess
+    import sys
+
+    heavy = ["torch", "sentence_transformers", "nltk", "textblob"]
+    code = (
+        "import sys, json\n"
+        "import src.nlp.semantic_search, src.nlp.entity_extractor, src.nlp.sentiment\n"
+        "import src.nlp.preprocessor, src.database.query, src.models.resilience\n"
+        f"print(json.dumps([m for m in {heavy!r} if m in sys.modules]))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                            check=True, cwd=os.path.dirname(os.path.dirname(__file__)))
+
+    # Loaded on first use (or by the background warmup), not at import
+    assert json.loads(result.stdout) == []
+
+
+def test_import_profile_parses_importtime_output():
+    from src.utils.import_profile import parse_importtime, summarise
+
+    output = "\n".join([
+        "import time: self [us] | cumulative | imported package",
+        "import time:       150 |        150 |   _io",
+        "import time:      2000 |       2000 |     numpy.core",
+        "import time:      1000 |       3000 |   numpy",
+        "import time:       500 |       3650 | src.nlp.semantic_search",
+        "Traceback noise that isn't a timing line",
+    ])
+
+    entries = parse_importtime(output)
+
+    assert [(e["module"], e["depth"]) for e in entries] == [
+        ("_io", 1), ("numpy.core", 2), ("numpy", 1), ("src.nlp.semantic_search", 0)]
+    assert entries[3]["self_ms"] == 0.5 and entries[3]["cumulative_ms"] == 3.65
+
+    summary = summarise(entries, top=2)
+    assert summary["total_ms"] == 3.65
+    assert summary["module_count"] == 4
+    assert summary["slowest_packages"] == [{"package": "numpy", "self_ms": 3.0},
+                                           {"package": "src", "self_ms": 0.5}]
+    assert [e["module"] for e in summary["slowest_modules"]] == ["numpy.core", "numpy"]